@@ -1,7 +1,8 @@
-from datetime import date
+from datetime import date, datetime
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.backend.core import crud as analytic_crud
@@ -27,14 +28,35 @@ def get_categories(db: Session = Depends(get_db)):
 
 
 @router.get("/export/{table_name}")
-def export_data(table_name: str, db: Session = Depends(get_db)):
+def export_data(
+    table_name: str,
+    since: Optional[datetime] = None,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|parquet)$"),
+    db: Session = Depends(get_db),
+):
+    if export_format == "parquet":
+        if table_name != "wypozyczenia" or since is not None:
+            raise HTTPException(status_code=400,
+                                detail="Format parquet to pełny eksport faktów tabeli wypozyczenia.")
+        return StreamingResponse(
+            analytic_crud.stream_rental_facts_parquet(db),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": "attachment; filename=wypozyczenia_fakty.parquet"},
+        )
+
     try:
-        csv_content = analytic_crud.export_to_csv(db, table_name)
+        table = analytic_crud.get_export_table(table_name)
+        query, watermark = analytic_crud.build_export_query(db, table, since)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    return Response(
-        content=csv_content,
+    headers = {"Content-Disposition": f"attachment; filename={table_name}.csv"}
+    if watermark is not None:
+        # Kolejny eksport przyrostowy: ?since=<X-Next-Watermark>; eksporty zachodzą na siebie, odbiorca deduplikuje po id
+        headers["X-Next-Watermark"] = watermark.isoformat()
+
+    return StreamingResponse(
+        analytic_crud.stream_export(db, table, query),
         media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={table_name}.csv"},
+        headers=headers,
     )
@@ -1,12 +1,12 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
+from app.backend.core import pagination
 from app.backend.core.database import get_db
 from app.backend.modules.inventory import crud as inv_crud
-from app.backend.modules.inventory import models as inv_models
 from app.backend.modules.inventory import schemas as inv_schemas
 from app.backend.modules.rentals import crud as rent_crud
 
@@ -17,27 +17,18 @@ def _model_count_row(model, count: int) -> dict:
     return {"ModelNarzedzia": model, "liczba_sztuk": count}
 
 
-def _item_to_flat_json(item: inv_models.EgzemplarzNarzedzia) -> dict:
-    return {
-        "id": item.id,
-        "model_name": item.model.nazwa_modelu,
-        "category": item.model.kategoria,
-        "producer": item.model.producent,
-        "sn": item.numer_seryjny,
-        "stan": item.stan_techniczny,
-        "status": item.status,
-        "licznik": item.licznik_wypozyczen,
-    }
-
-
 @router.get("/models", response_model=List[inv_schemas.ToolModelSummaryRead])
 def get_catalog(
     search: Optional[str] = None,
     category: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
 ):
-    results = inv_crud.list_models_with_available_counts(db, search=search, category=category)
-    return [_model_count_row(model, count) for model, count in results]
+    etag, body = inv_crud.get_catalog_payload(db, search=search, category=category)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/models/{model_id}/availability")
@@ -47,8 +38,41 @@ def check_availability(
     end_dt: datetime,
     db: Session = Depends(get_db),
 ):
-    available = inv_crud.get_available_items_for_term(db, model_id, start_dt, end_dt)
-    return {"count": len(available)}
+    return {"count": inv_crud.count_available_items_for_term(db, model_id, start_dt, end_dt)}
+
+
+@router.get("/models/{model_id}/calendar")
+def get_availability_calendar(
+    model_id: int,
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    db: Session = Depends(get_db),
+):
+    try:
+        return inv_crud.get_availability_calendar(db, model_id, date_from, date_to)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get("/models/{model_id}/next-available")
+def find_next_available(
+    model_id: int,
+    qty: int = Query(1, ge=1),
+    duration_days: int = Query(1, ge=1),
+    after: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    window = inv_crud.find_next_available_window(db, model_id, qty, duration_days, after or date.today())
+    if not window:
+        raise HTTPException(status_code=404, detail="Model nie ma tylu sprawnych egzemplarzy.")
+    return window
+
+
+@router.post("/availability/batch", response_model=List[inv_schemas.ModelAvailabilityRead])
+def check_availability_batch(payload: inv_schemas.AvailabilityBatchRequest, db: Session = Depends(get_db)):
+    model_ids = list(dict.fromkeys(payload.model_ids))
+    counts = inv_crud.count_available_items_for_models(db, model_ids, payload.start_dt, payload.end_dt)
+    return [{"model_id": model_id, "count": count} for model_id, count in counts.items()]
 
 
 @router.get("/models/{model_id}/opinions")
@@ -81,7 +105,11 @@ def get_models_summary(db: Session = Depends(get_db)):
 
 
 @router.post("/items/bulk", status_code=status.HTTP_201_CREATED)
-def bulk_add_items(model_id: int, quantity: int, db: Session = Depends(get_db)):
+def bulk_add_items(
+    model_id: int,
+    quantity: int = Query(..., ge=1, le=inv_crud.BULK_ITEMS_MAX),
+    db: Session = Depends(get_db),
+):
     try:
         inv_crud.bulk_create_items(db, model_id, quantity)
     except Exception as exc:
@@ -90,36 +118,52 @@ def bulk_add_items(model_id: int, quantity: int, db: Session = Depends(get_db)):
     return {"message": f"Pomyślnie dodano {quantity} egzemplarzy do bazy."}
 
 
-@router.get("/items", response_model=List[dict])
+@router.post("/import", status_code=status.HTTP_201_CREATED)
+def import_inventory(body: bytes = Body(..., media_type="text/csv"), db: Session = Depends(get_db)):
+    try:
+        content = body.decode("utf-8-sig")
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=400, detail="Plik CSV musi być zapisany w UTF-8.") from exc
+
+    try:
+        return inv_crud.import_inventory_csv(db, content)
+    except inv_crud.ImportValidationError as exc:
+        raise HTTPException(status_code=400, detail={"message": str(exc), "errors": exc.errors}) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get("/items")
 def list_all_items(
     search: Optional[str] = None,
     category: Optional[str] = None,
     producer: Optional[str] = None,
     location: Optional[str] = None,
     tech_state: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    with_total: bool = False,
     db: Session = Depends(get_db),
 ):
-    query = db.query(inv_models.EgzemplarzNarzedzia).join(inv_models.ModelNarzedzia)
+    return inv_crud.list_items(
+        db, search=search, category=category, producer=producer, location=location, tech_state=tech_state,
+        limit=limit, cursor=cursor, with_total=with_total,
+    )
 
-    if search:
-        query = query.filter(
-            inv_models.ModelNarzedzia.nazwa_modelu.ilike(f"%{search}%")
-            | inv_models.EgzemplarzNarzedzia.numer_seryjny.ilike(f"%{search}%")
-        )
 
-    if category and category != "Wszystkie":
-        query = query.filter(inv_models.ModelNarzedzia.kategoria == category)
+@router.patch("/items/bulk/state", response_model=inv_schemas.BulkTransitionRead)
+def bulk_update_technical_state(payload: inv_schemas.BulkStateRequest, db: Session = Depends(get_db)):
+    return inv_crud.bulk_update_technical_state(db, payload.item_ids, payload.new_state)
 
-    if producer and producer != "Wszyscy":
-        query = query.filter(inv_models.ModelNarzedzia.producent == producer)
 
-    if location and location != "Wszystkie":
-        query = query.filter(inv_models.EgzemplarzNarzedzia.status == location)
+@router.post("/items/bulk/send-to-service", response_model=inv_schemas.BulkTransitionRead)
+def bulk_send_to_service(payload: inv_schemas.BulkItemsRequest, db: Session = Depends(get_db)):
+    return inv_crud.bulk_send_to_service(db, payload.item_ids)
 
-    if tech_state and tech_state != "Wszystkie":
-        query = query.filter(inv_models.EgzemplarzNarzedzia.stan_techniczny == tech_state)
 
-    return [_item_to_flat_json(item) for item in query.all()]
+@router.post("/items/bulk/receive-from-service", response_model=inv_schemas.BulkTransitionRead)
+def bulk_receive_from_service(payload: inv_schemas.BulkItemsRequest, db: Session = Depends(get_db)):
+    return inv_crud.bulk_receive_from_service(db, payload.item_ids)
 
 
 @router.patch("/items/{item_id}/state")
@@ -149,6 +193,11 @@ def receive_from_service(item_id: int, db: Session = Depends(get_db)):
     return {"message": "Narzędzie zostało przyjęte do magazynu i jest gotowe do wypożyczenia."}
 
 
+@router.post("/counters/reconcile")
+def reconcile_model_counters(db: Session = Depends(get_db)):
+    return inv_crud.reconcile_model_counters(db)
+
+
 @router.post("/models", status_code=status.HTTP_201_CREATED)
 def add_tool_model(payload: inv_schemas.ToolModelCreate, db: Session = Depends(get_db)):
     return inv_crud.create_tool_model(db, payload)
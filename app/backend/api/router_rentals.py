@@ -1,12 +1,14 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
+from app.backend.core import pagination
 from app.backend.core.database import get_db
-from app.backend.modules.inventory import models as inv_models
+from app.backend.modules.inventory import crud as inv_crud
 from app.backend.modules.rentals import crud as rent_crud
+from app.backend.modules.rentals import occupancy
 from app.backend.modules.rentals import schemas as rent_schemas
 
 router = APIRouter(prefix="/rentals", tags=["Rentals & Service"])
@@ -16,39 +18,35 @@ def _iso(dt):
     return dt.isoformat() if dt else None
 
 
-def _rental_position_payload(pos) -> dict:
-    egz = pos.egzemplarz
+def _rental_position_payload(pos: dict) -> dict:
     return {
         "egzemplarz": {
-            "model_id": egz.model_id,
-            "model": {"nazwa_modelu": egz.model.nazwa_modelu},
-            "numer_seryjny": egz.numer_seryjny,
+            "model_id": pos["model_id"],
+            "model": {"nazwa_modelu": pos["nazwa_modelu"]},
+            "numer_seryjny": pos["numer_seryjny"],
         }
     }
 
 
-def _rental_history_row(rental) -> dict:
-    pozycje = [p for p in rental.pozycje if p.egzemplarz]
-
-    suma_kaucji = sum(p.egzemplarz.model.kaucja for p in pozycje)
-    suma_dniowki = sum(p.egzemplarz.model.cena_za_dobe for p in pozycje)
-
-    dni = (rental.data_plan_zwrotu - rental.data_plan_wydania).days
+def _rental_history_row(rental: dict) -> dict:
+    dni = (rental["data_plan_zwrotu"] - rental["data_plan_wydania"]).days
     if dni <= 0:
         dni = 1
 
-    koszt_najmu = dni * suma_dniowki
+    koszt_najmu = dni * rental["suma_dniowki"]
+    suma_kaucji = rental["suma_kaucji"]
     return {
-        "id": rental.id,
-        "status": rental.status,
+        "id": rental["id"],
+        "status": rental["status"],
         "koszt_najmu": koszt_najmu,
         "suma_kaucji": suma_kaucji,
         "koszt_calkowity": koszt_najmu + suma_kaucji,
-        "data_plan_wydania": _iso(rental.data_plan_wydania),
-        "data_plan_zwrotu": _iso(rental.data_plan_zwrotu),
-        "data_faktyczna_wydania": _iso(rental.data_faktyczna_wydania),
-        "data_faktyczna_zwrotu": _iso(rental.data_faktyczna_zwrotu),
-        "pozycje": [_rental_position_payload(p) for p in rental.pozycje],
+        "liczba_pozycji": rental["liczba_pozycji"],
+        "data_plan_wydania": _iso(rental["data_plan_wydania"]),
+        "data_plan_zwrotu": _iso(rental["data_plan_zwrotu"]),
+        "data_faktyczna_wydania": _iso(rental["data_faktyczna_wydania"]),
+        "data_faktyczna_zwrotu": _iso(rental["data_faktyczna_zwrotu"]),
+        "pozycje": [_rental_position_payload(p) for p in rental["pozycje"]],
     }
 
 
@@ -80,10 +78,24 @@ def create_reservation(
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
+@router.post("/cart", status_code=status.HTTP_201_CREATED)
+def create_cart_reservation(payload: rent_schemas.CreateRentalRequest, db: Session = Depends(get_db)):
+    try:
+        return rent_crud.create_cart_reservation(db, payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
 @router.get("/customer/{client_id}")
-def get_history(client_id: int, db: Session = Depends(get_db)):
-    rentals = rent_crud.get_customer_rentals(db, client_id)
-    return [_rental_history_row(r) for r in rentals]
+def get_history(
+    client_id: int,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    with_total: bool = False,
+    db: Session = Depends(get_db),
+):
+    page = rent_crud.get_customer_rentals(db, client_id, limit=limit, cursor=cursor, with_total=with_total)
+    return {**page, "items": [_rental_history_row(r) for r in page["items"]]}
 
 
 @router.get("/customer/{client_id}/issued")
@@ -120,31 +132,16 @@ def get_workshop_items(
     category: Optional[str] = None,
     producer: Optional[str] = None,
     status_tech: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    with_total: bool = False,
     db: Session = Depends(get_db),
 ):
-    query = (
-        db.query(inv_models.EgzemplarzNarzedzia)
-        .filter(inv_models.EgzemplarzNarzedzia.status == "W_WARSZTACIE")
-        .join(inv_models.ModelNarzedzia)
+    return inv_crud.list_items(
+        db, search=search, category=category, producer=producer, location="W_WARSZTACIE",
+        tech_state=status_tech, limit=limit, cursor=cursor, with_total=with_total,
     )
 
-    if search:
-        query = query.filter(
-            inv_models.ModelNarzedzia.nazwa_modelu.ilike(f"%{search}%")
-            | inv_models.EgzemplarzNarzedzia.numer_seryjny.ilike(f"%{search}%")
-        )
-
-    if category and category != "Wszystkie":
-        query = query.filter(inv_models.ModelNarzedzia.category == category)
-
-    if producer and producer != "Wszyscy":
-        query = query.filter(inv_models.ModelNarzedzia.producent == producer)
-
-    if status_tech and status_tech != "Wszystkie":
-        query = query.filter(inv_models.EgzemplarzNarzedzia.stan_techniczny == status_tech)
-
-    return query.all()
-
 
 @router.post("/service-action", tags=["Technician"])
 def create_service_action(
@@ -168,8 +165,41 @@ def create_service_action(
 
 
 @router.get("/pending", tags=["Warehouse"])
-def get_pending_operations(db: Session = Depends(get_db)):
-    return rent_crud.list_pending_operations(db)
+def get_pending_operations(
+    typ: Optional[str] = Query(None, pattern="^(WYDANIE|ZWROT)$"),
+    client_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    search: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    with_total: bool = False,
+    db: Session = Depends(get_db),
+):
+    return rent_crud.list_pending_operations(
+        db, typ=typ, client_id=client_id, date_from=date_from, date_to=date_to, search=search,
+        limit=limit, cursor=cursor, with_total=with_total,
+    )
+
+
+@router.post("/occupancy/verify", tags=["Warehouse"])
+def verify_occupancy_index(repair: bool = True, db: Session = Depends(get_db)):
+    if not occupancy.index.ready:
+        return {"enabled": False}
+    return {"enabled": True, **occupancy.index.verify(db, repair=repair)}
+
+
+@router.post("/process", tags=["Warehouse"])
+def process_rentals(payload: rent_schemas.BatchRentalActionRequest, db: Session = Depends(get_db)):
+    return rent_crud.process_rental_actions(db, payload.wypozyczenie_ids, payload.action)
+
+
+@router.post("/{rental_id}/return", tags=["Warehouse"])
+def register_return(rental_id: int, payload: rent_schemas.RegisterReturnRequest, db: Session = Depends(get_db)):
+    try:
+        return rent_crud.register_return(db, rental_id, payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
 @router.post("/{rental_id}/process", tags=["Warehouse"])
@@ -0,0 +1,64 @@
+"""Cache wyników w pamięci procesu: TTL + LRU, unieważniany po tematach.
+
+Temat to nazwa tabeli (np. ``"wypozyczenia"``). Ścieżki zapisu wołają
+``invalidate(<tabela>)`` po commicie, a każdy cache czyści się, gdy zmieni się
+którykolwiek z tematów, od których zależy. Cache jest lokalny dla workera,
+dlatego TTL ogranicza czas, przez jaki inne workery mogą widzieć stare dane.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_lock = threading.Lock()
+_subscribers: dict[str, list["ResultCache"]] = {}
+_versions: dict[str, int] = {}
+
+
+class ResultCache:
+    def __init__(self, *topics: str, maxsize: int = 128, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        with _lock:
+            for topic in topics:
+                _subscribers.setdefault(topic, []).append(self)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def invalidate(*topics: str) -> None:
+    with _lock:
+        caches = []
+        for topic in topics:
+            _versions[topic] = _versions.get(topic, 0) + 1
+            caches.extend(_subscribers.get(topic, []))
+    for cache in caches:
+        cache.clear()
+
+
+def version(*topics: str) -> int:
+    with _lock:
+        return sum(_versions.get(topic, 0) for topic in topics)
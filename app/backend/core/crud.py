@@ -1,10 +1,17 @@
 import csv
 import io
+import queue
+import tempfile
+import threading
 from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
 
-from sqlalchemy import Date, cast, func
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Date, Select, Table, cast, func, select
 from sqlalchemy.orm import Session
 
+from app.backend.core.cache import ResultCache
 from app.backend.modules.inventory import models as inv_models
 from app.backend.modules.rentals import models as rental_models
 from app.backend.modules.users import models as user_models
@@ -19,34 +26,52 @@ _EXPORT_MAP = {
     "opinie": rental_models.Opinia,
 }
 
+EXPORT_CHUNK_SIZE = 2000
+COPY_SPOOL_SIZE = 16 * 1024 * 1024
+COPY_CHUNK_BYTES = 256 * 1024
+COPY_QUEUE_CHUNKS = 8
+PARQUET_BATCH_SIZE = 20000
+# Zapas znaku wodnego eksportu przyrostowego: najdłuższa transakcja zapisu + rozjazd zegarów
+EXPORT_WATERMARK_LAG = timedelta(minutes=5)
+
+_summary_cache = ResultCache("wypozyczenia", maxsize=64, ttl=300)
+
+
+def _summary_version(db: Session, date_from: date, date_to: date) -> tuple:
+    """Wersja wierszy dziennych z zakresu, liczona w bazie - wspólna dla wszystkich workerów.
+
+    Każde dopisanie do ``dzienne_statystyki`` podbija ``wersja`` albo dodaje wiersz,
+    a ``rollup.rebuild`` wstawia wiersze z nowymi ID.
+    """
+    stats = rental_models.DzienneStatystyki
+    return tuple(db.execute(
+        select(func.count(stats.id), func.max(stats.id), func.sum(stats.wersja))
+        .where(stats.model_id.is_(None), stats.dzien.between(date_from, date_to))
+    ).one())
+
 
 def get_dashboard_summary(db: Session, date_from: date, date_to: date):
-    start_dt = datetime.combine(date_from, datetime.min.time())
-    end_dt = datetime.combine(date_to, datetime.max.time())
-
-    total_rentals = (
-        db.query(func.count(rental_models.Wypozyczenie.id))
-        .filter(rental_models.Wypozyczenie.data_rezerwacji.between(start_dt, end_dt))
-        .scalar()
-        or 0
-    )
+    # Klucz z wersją z bazy: zapis obsłużony przez inny worker też unieważnia wpis
+    key = (date_from, date_to, _summary_version(db, date_from, date_to))
+    summary = _summary_cache.get(key)
+    if summary is None:
+        summary = _compute_dashboard_summary(db, date_from, date_to)
+        _summary_cache.set(key, summary)
+    return summary
 
-    total_revenue = (
-        db.query(func.sum(rental_models.Wypozyczenie.koszt_calkowity))
-        .filter(rental_models.Wypozyczenie.data_rezerwacji.between(start_dt, end_dt))
-        .scalar()
-        or 0
-    )
+
+def _compute_dashboard_summary(db: Session, date_from: date, date_to: date):
+    stats = rental_models.DzienneStatystyki
 
     daily_stats_raw = (
         db.query(
-            func.date(rental_models.Wypozyczenie.data_rezerwacji).label("date"),
-            func.sum(rental_models.Wypozyczenie.koszt_calkowity).label("revenue"),
-            func.count(rental_models.Wypozyczenie.id).label("count"),
+            stats.dzien.label("date"),
+            func.sum(stats.przychod).label("revenue"),
+            func.sum(stats.liczba_wypozyczen).label("count"),
         )
-        .filter(rental_models.Wypozyczenie.data_rezerwacji.between(start_dt, end_dt))
-        .group_by(func.date(rental_models.Wypozyczenie.data_rezerwacji))
-        .order_by("date")
+        .filter(stats.model_id.is_(None), stats.dzien.between(date_from, date_to))
+        .group_by(stats.dzien)
+        .order_by(stats.dzien)
         .all()
     )
 
@@ -56,71 +81,227 @@ def get_dashboard_summary(db: Session, date_from: date, date_to: date):
     ]
 
     return {
-        "total_rentals": int(total_rentals),
-        "total_revenue": float(total_revenue),
+        "total_rentals": sum(row["count"] for row in daily_stats),
+        "total_revenue": float(sum(row.revenue or 0 for row in daily_stats_raw)),
         "daily_stats": daily_stats,
     }
 
 
 def get_top_performing_models(db: Session, limit: int = 5):
+    stats = rental_models.DzienneStatystyki
+    rent_count = func.sum(stats.liczba_pozycji)
+
     results = (
-        db.query(
-            inv_models.ModelNarzedzia.nazwa_modelu,
-            func.count(rental_models.PozycjaWypozyczenia.id).label("rent_count"),
-        )
-        .select_from(inv_models.ModelNarzedzia)
-        .join(
-            inv_models.EgzemplarzNarzedzia,
-            inv_models.ModelNarzedzia.id == inv_models.EgzemplarzNarzedzia.model_id,
-        )
-        .join(
-            rental_models.PozycjaWypozyczenia,
-            inv_models.EgzemplarzNarzedzia.id == rental_models.PozycjaWypozyczenia.egzemplarz_id,
-        )
+        db.query(inv_models.ModelNarzedzia.nazwa_modelu, rent_count.label("rent_count"))
+        .select_from(stats)
+        .join(inv_models.ModelNarzedzia, inv_models.ModelNarzedzia.id == stats.model_id)
         .group_by(inv_models.ModelNarzedzia.id, inv_models.ModelNarzedzia.nazwa_modelu)
-        .order_by(func.count(rental_models.PozycjaWypozyczenia.id).desc())
+        .order_by(rent_count.desc())
         .limit(limit)
         .all()
     )
 
-    return [{"model_name": row.nazwa_modelu, "rent_count": row.rent_count} for row in results]
+    return [{"model_name": row.nazwa_modelu, "rent_count": int(row.rent_count)} for row in results]
 
 
 def get_category_distribution(db: Session):
+    stats = rental_models.DzienneStatystyki
+
     results = (
-        db.query(
-            inv_models.ModelNarzedzia.kategoria,
-            func.count(rental_models.PozycjaWypozyczenia.id).label("count"),
-        )
-        .select_from(inv_models.ModelNarzedzia)
-        .join(
-            inv_models.EgzemplarzNarzedzia,
-            inv_models.ModelNarzedzia.id == inv_models.EgzemplarzNarzedzia.model_id,
-        )
-        .join(
-            rental_models.PozycjaWypozyczenia,
-            inv_models.EgzemplarzNarzedzia.id == rental_models.PozycjaWypozyczenia.egzemplarz_id,
-        )
-        .group_by(inv_models.ModelNarzedzia.kategoria)
+        db.query(stats.kategoria, func.sum(stats.liczba_pozycji).label("count"))
+        .filter(stats.model_id.is_not(None))
+        .group_by(stats.kategoria)
         .all()
     )
 
-    return [{"kategoria": row.kategoria, "count": row.count} for row in results]
+    return [{"kategoria": row.kategoria, "count": int(row.count)} for row in results]
 
 
-def export_to_csv(db: Session, table_name: str) -> str:
+def get_export_table(table_name: str) -> Table:
     model = _EXPORT_MAP.get(table_name)
     if not model:
         raise ValueError(f"Tabela {table_name} nie jest dostępna do eksportu.")
+    return model.__table__
+
+
+def build_export_query(db: Session, table: Table, since: Optional[datetime] = None) -> tuple[Select, Optional[datetime]]:
+    """Zapytanie eksportu i znak wodny (watermark) dla następnego eksportu przyrostowego.
+
+    Z ``since`` eksport obejmuje wiersze z ``data_modyfikacji >= since``.
+    ``data_modyfikacji`` stempluje aplikacja przy flushu, a nie baza przy commicie,
+    więc wiersz ostemplowany przed odczytem może stać się widoczny dopiero po nim.
+    Watermark to chwila odczytu cofnięta o EXPORT_WATERMARK_LAG (dłużej niż trwa
+    transakcja zapisu i niż rozjazd zegarów hostów API), dlatego każda zmiana trafi
+    do eksportu co najmniej raz. Kolejne eksporty zachodzą na siebie - odbiorca
+    deduplikuje wiersze po kluczu głównym (``id``), zostawiając ten z najpóźniejszą
+    ``data_modyfikacji``.
+    """
+    query = select(table).order_by(*table.primary_key.columns)
+    if "data_modyfikacji" not in table.c:
+        if since is not None:
+            raise ValueError(f"Tabela {table.name} nie obsługuje eksportu przyrostowego.")
+        return query, None
+
+    # Ten sam zegar co domyślna wartość data_modyfikacji (datetime.utcnow w aplikacji)
+    watermark = datetime.utcnow() - EXPORT_WATERMARK_LAG
+    if since is None:
+        return query, watermark
+    return query.where(table.c.data_modyfikacji >= since), max(since, watermark)
 
-    rows = db.query(model).all()
-    columns = [c.name for c in model.__table__.columns]
 
+def stream_export(db: Session, table: Table, query: Select) -> Iterator:
+    if db.get_bind().dialect.name == "postgresql":
+        return _stream_pg_copy(db, query)
+    return _stream_csv_rows(db, table, query)
+
+
+class _CopyChunkWriter:
+    """Plik dla ``copy_expert``: skleja wiersze COPY w porcje i oddaje je do kolejki."""
+
+    def __init__(self, chunks: queue.Queue, stop: threading.Event):
+        self._chunks = chunks
+        self._stop = stop
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        if self._stop.is_set():
+            return len(data)
+        self._buffer += data
+        if len(self._buffer) >= COPY_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        while self._buffer and not self._stop.is_set():
+            try:
+                self._chunks.put(bytes(self._buffer), timeout=1)
+            except queue.Full:
+                continue
+            self._buffer.clear()
+
+
+def _stream_pg_copy(db: Session, query) -> Iterator[bytes]:
+    """COPY ... TO STDOUT przez surowe połączenie psycopg2, bez obiektów ORM i modułu csv.
+
+    ``copy_expert`` blokuje do końca COPY, więc działa w osobnym wątku i oddaje
+    porcje przez kolejkę ograniczoną do COPY_QUEUE_CHUNKS - klient dostaje dane
+    od pierwszej porcji, a w pamięci jest najwyżej kilka porcji naraz. Gdy klient
+    się rozłączy, zapytanie jest anulowane.
+    """
+    compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    raw_connection = db.connection().connection
+    cursor = raw_connection.cursor()
+    sql = cursor.mogrify(str(compiled), compiled.params).decode()
+
+    chunks: queue.Queue = queue.Queue(maxsize=COPY_QUEUE_CHUNKS)
+    stop = threading.Event()
+    done = object()
+
+    def run_copy():
+        writer = _CopyChunkWriter(chunks, stop)
+        try:
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV HEADER", writer)
+            writer.flush()
+            result = done
+        except Exception as exc:
+            result = exc
+        while not stop.is_set():
+            try:
+                chunks.put(result, timeout=1)
+                break
+            except queue.Full:
+                continue
+
+    worker = threading.Thread(target=run_copy, name="export-copy", daemon=True)
+    worker.start()
+    try:
+        while (chunk := chunks.get()) is not done:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        if worker.is_alive():
+            stop.set()
+            raw_connection.cancel()
+        worker.join()
+        cursor.close()
+
+
+def _stream_csv_rows(db: Session, table: Table, query) -> Iterator[str]:
+    """Wariant dla SQLite: krotki z kursora porcjami po EXPORT_CHUNK_SIZE wierszy."""
     output = io.StringIO()
     writer = csv.writer(output)
 
-    writer.writerow(columns)
-    for r in rows:
-        writer.writerow([getattr(r, col) for col in columns])
+    writer.writerow([c.name for c in table.columns])
+    result = db.execute(query, execution_options={"yield_per": EXPORT_CHUNK_SIZE})
+    for rows in result.partitions():
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+    if output.tell():
+        yield output.getvalue()
+
+
+def _rental_fact_columns():
+    wyp = rental_models.Wypozyczenie
+    poz = rental_models.PozycjaWypozyczenia
+    egz = inv_models.EgzemplarzNarzedzia
+    mod = inv_models.ModelNarzedzia
+    kli = user_models.Klient
+
+    money = pa.decimal128(12, 2)
+    ts = pa.timestamp("us")
+    return [
+        ("wypozyczenie_id", wyp.id, pa.int64()),
+        ("pozycja_id", poz.id, pa.int64()),
+        ("status", wyp.status, pa.string()),
+        ("klient_id", kli.id, pa.int64()),
+        ("klient", kli.imie + " " + kli.nazwisko, pa.string()),
+        ("egzemplarz_id", egz.id, pa.int64()),
+        ("numer_seryjny", egz.numer_seryjny, pa.string()),
+        ("model_id", mod.id, pa.int64()),
+        ("nazwa_modelu", mod.nazwa_modelu, pa.string()),
+        ("producent", mod.producent, pa.string()),
+        ("kategoria", mod.kategoria, pa.string()),
+        ("cena_za_dobe", mod.cena_za_dobe, money),
+        ("kaucja", mod.kaucja, money),
+        ("koszt_calkowity", wyp.koszt_calkowity, money),
+        ("data_rezerwacji", wyp.data_rezerwacji, ts),
+        ("data_plan_wydania", wyp.data_plan_wydania, ts),
+        ("data_plan_zwrotu", wyp.data_plan_zwrotu, ts),
+        ("data_faktyczna_wydania", wyp.data_faktyczna_wydania, ts),
+        ("data_faktyczna_zwrotu", wyp.data_faktyczna_zwrotu, ts),
+    ]
+
+
+def stream_rental_facts_parquet(db: Session) -> Iterator[bytes]:
+    """Zdenormalizowane fakty wypożyczeń (wiersz = pozycja) jako Parquet z kompresją zstd.
+
+    Wiersze idą z kursora porcjami po PARQUET_BATCH_SIZE i każda porcja staje się
+    osobną grupą wierszy, więc w pamięci nie ma naraz całego wyniku.
+    """
+    columns = _rental_fact_columns()
+    schema = pa.schema([(name, arrow_type) for name, _, arrow_type in columns])
+    query = (
+        select(*(expr.label(name) for name, expr, _ in columns))
+        .select_from(rental_models.PozycjaWypozyczenia)
+        .join(rental_models.Wypozyczenie,
+              rental_models.Wypozyczenie.id == rental_models.PozycjaWypozyczenia.wypozyczenie_id)
+        .join(inv_models.EgzemplarzNarzedzia,
+              inv_models.EgzemplarzNarzedzia.id == rental_models.PozycjaWypozyczenia.egzemplarz_id)
+        .join(inv_models.ModelNarzedzia, inv_models.ModelNarzedzia.id == inv_models.EgzemplarzNarzedzia.model_id)
+        .join(user_models.Klient, user_models.Klient.id == rental_models.Wypozyczenie.klient_id)
+        .order_by(rental_models.Wypozyczenie.id, rental_models.PozycjaWypozyczenia.id)
+    )
 
-    return output.getvalue()
+    with tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_SIZE) as buffer:
+        with pq.ParquetWriter(buffer, schema, compression="zstd") as writer:
+            result = db.execute(query, execution_options={"yield_per": PARQUET_BATCH_SIZE})
+            for rows in result.partitions():
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        buffer.seek(0)
+        while chunk := buffer.read(COPY_CHUNK_BYTES):
+            yield chunk
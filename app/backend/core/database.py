@@ -30,6 +30,9 @@ class Base(DeclarativeBase):
 
 class TimestampMixin:
     data_utworzenia: Mapped[datetime] = mapped_column(default=func.now(), sort_order=999)
+    # Znacznik dla eksportów przyrostowych - odświeżany przy każdym UPDATE
+    data_modyfikacji: Mapped[datetime] = mapped_column(default=datetime.utcnow, onupdate=datetime.utcnow,
+                                                      index=True, sort_order=1000)
 
 # TYLKO DLA SQLITE
 @event.listens_for(Engine, "connect")
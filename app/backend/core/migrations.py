@@ -0,0 +1,207 @@
+"""Idempotentne kroki schematu uruchamiane przy starcie API.
+
+Baza produkcyjna powstaje ze zrzutu ``init-db/backup.sql``, więc nowe indeksy,
+kolumny i tabele dokładamy tutaj. Każdy krok musi dać się bezpiecznie
+powtórzyć przy każdym restarcie i pomija tabele, których jeszcze nie ma.
+"""
+from typing import Optional
+
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from app.backend.core import rollup
+from app.backend.modules.inventory import counters
+from app.backend.modules.inventory import models as inv_models
+from app.backend.modules.inventory import search
+from app.backend.modules.rentals import models as rental_models
+from app.backend.modules.users import models as user_models
+
+
+def _ensure_indexes(conn: Connection, *orm_models) -> None:
+    inspector = inspect(conn)
+    for orm_model in orm_models:
+        table = orm_model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            # Indeks na kolumnie dokładanej przez późniejszy krok powstanie razem z nią
+            if all(col.name in existing for col in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def _add_missing_columns(conn: Connection, orm_model, defaults: dict[str, str] = None,
+                         only: tuple[str, ...] = None) -> list[str]:
+    """Dodaje kolumny modelu ORM (lub tylko ``only``), których brakuje w tabeli. Zwraca nazwy dodanych."""
+    table = orm_model.__table__
+    inspector = inspect(conn)
+    if not inspector.has_table(table.name):
+        return []
+
+    existing = {col["name"] for col in inspector.get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing or (only and column.name not in only):
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+        if defaults and column.name in defaults:
+            ddl += f" DEFAULT {defaults[column.name]}"
+        conn.execute(text(ddl))
+        added.append(column.name)
+    return added
+
+
+def _pg_constraint_def(conn: Connection, name: str) -> Optional[str]:
+    return conn.execute(
+        text("SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = :name"), {"name": name},
+    ).scalar()
+
+
+def _availability_indexes(conn: Connection) -> None:
+    # Anti-join dostępności: egzemplarze modelu -> pozycje -> aktywne wypożyczenia
+    _ensure_indexes(
+        conn,
+        inv_models.EgzemplarzNarzedzia,
+        rental_models.PozycjaWypozyczenia,
+        rental_models.Wypozyczenie,
+    )
+
+
+def _position_booking_ranges(conn: Connection) -> None:
+    pozycje = rental_models.PozycjaWypozyczenia.__table__
+    wypozyczenia = rental_models.Wypozyczenie.__table__
+
+    added = _add_missing_columns(conn, rental_models.PozycjaWypozyczenia, defaults={"aktywna": "TRUE"})
+    if added:
+        parent = select(wypozyczenia).where(wypozyczenia.c.id == pozycje.c.wypozyczenie_id)
+        conn.execute(
+            update(pozycje).values(
+                okres_od=parent.with_only_columns(wypozyczenia.c.data_plan_wydania).scalar_subquery(),
+                okres_do=parent.with_only_columns(wypozyczenia.c.data_plan_zwrotu).scalar_subquery(),
+                aktywna=parent.with_only_columns(
+                    wypozyczenia.c.status.in_(rental_models.ACTIVE_RENTAL_STATUSES)
+                ).scalar_subquery(),
+            )
+        )
+
+    if conn.dialect.name != "postgresql":
+        return
+    # Wersja bez warunku IS NOT NULL traktowała pozycje bez terminu jak zajęte bez końca
+    definition = _pg_constraint_def(conn, "ex_pozycje_egzemplarz_okres")
+    if definition is not None and "IS NOT NULL" in definition:
+        return
+
+    # Ten sam egzemplarz nie może mieć dwóch aktywnych pozycji o nachodzących terminach.
+    # Pozycje bez terminu pomijamy tak jak _not_booked_in_term - nie blokują sztuki.
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+            conn.execute(text("ALTER TABLE pozycje_wypozyczenia DROP CONSTRAINT IF EXISTS ex_pozycje_egzemplarz_okres"))
+            conn.execute(text(
+                "ALTER TABLE pozycje_wypozyczenia ADD CONSTRAINT ex_pozycje_egzemplarz_okres "
+                "EXCLUDE USING gist (egzemplarz_id WITH =, tsrange(okres_od, okres_do, '[]') WITH &&) "
+                "WHERE (aktywna AND okres_od IS NOT NULL AND okres_do IS NOT NULL)"
+            ))
+    except DBAPIError as exc:
+        # Bez constraintu rezerwacje nie są chronione przed podwójnym przydziałem - nie startujemy
+        raise RuntimeError(
+            f"Nie udało się założyć ex_pozycje_egzemplarz_okres (podwójne rezerwacje w danych?): {exc.orig}"
+        ) from exc
+
+
+def _daily_stats_table(conn: Connection) -> None:
+    table = rental_models.DzienneStatystyki.__table__
+    inspector = inspect(conn)
+    if inspector.has_table(table.name) or not inspector.has_table(rental_models.Wypozyczenie.__tablename__):
+        return
+    table.create(conn)
+    rollup.rebuild(conn)
+
+
+def _daily_stats_version(conn: Connection) -> None:
+    _add_missing_columns(conn, rental_models.DzienneStatystyki, defaults={"wersja": "0"}, only=("wersja",))
+
+
+def _modification_timestamps(conn: Connection) -> None:
+    for orm_model in (user_models.Pracownik, user_models.Klient,
+                      inv_models.ModelNarzedzia, rental_models.Wypozyczenie):
+        table = orm_model.__table__
+        if not inspect(conn).has_table(table.name):
+            continue
+
+        added = _add_missing_columns(conn, orm_model, only=("data_utworzenia", "data_modyfikacji"))
+        if "data_utworzenia" in added and orm_model is rental_models.Wypozyczenie:
+            conn.execute(update(table).values(
+                data_utworzenia=table.c.data_rezerwacji,
+                data_modyfikacji=func.coalesce(
+                    table.c.data_faktyczna_zwrotu, table.c.data_faktyczna_wydania, table.c.data_rezerwacji,
+                ),
+            ))
+
+        # Także wiersze wstawione z pominięciem ORM (np. ze zrzutu SQL)
+        conn.execute(
+            update(table)
+            .where(table.c.data_modyfikacji.is_(None))
+            .values(data_modyfikacji=func.coalesce(table.c.data_utworzenia, func.now()))
+        )
+    _ensure_indexes(conn, user_models.Pracownik, user_models.Klient,
+                    inv_models.ModelNarzedzia, rental_models.Wypozyczenie)
+
+
+def _serial_counters(conn: Connection) -> None:
+    _add_missing_columns(conn, inv_models.ModelNarzedzia, defaults={"licznik_numerow": "0"})
+
+
+def _search_indexes(conn: Connection) -> None:
+    if conn.dialect.name != "postgresql":
+        return
+
+    inspector = inspect(conn)
+    # ILIKE '%fraza%' używa indeksów GIN z operatorami gin_trgm_ops
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for name, table, column in search.TRGM_INDEXES:
+                if inspector.has_table(table):
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"))
+    except DBAPIError as exc:
+        print(f"⚠️ Brak pg_trgm - wyszukiwanie bez indeksów trigramowych: {exc.orig}")
+
+
+def _model_counters_table(conn: Connection) -> None:
+    table = inv_models.StanModelu.__table__
+    inspector = inspect(conn)
+    if not inspector.has_table(inv_models.ModelNarzedzia.__tablename__):
+        return
+    if not inspector.has_table(table.name):
+        table.create(conn)
+    elif conn.execute(select(table.c.model_id).limit(1)).first() is not None:
+        return
+    # Pusta tabela (nowa albo z create_all) - liczniki z bieżących egzemplarzy
+    counters.reconcile(conn)
+
+
+def _catalog_versions(conn: Connection) -> None:
+    for orm_model in (inv_models.ModelNarzedzia, inv_models.StanModelu):
+        _add_missing_columns(conn, orm_model, defaults={"wersja": "0"}, only=("wersja",))
+
+
+MIGRATIONS = [
+    # Pierwszy: każdy UPDATE tych tabel (także w krokach niżej) ustawia wersja = wersja + 1
+    _catalog_versions,
+    _availability_indexes,
+    _position_booking_ranges,
+    _daily_stats_table,
+    _daily_stats_version,
+    _modification_timestamps,
+    _serial_counters,
+    _search_indexes,
+    _model_counters_table,
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    with engine.begin() as conn:
+        for step in MIGRATIONS:
+            step(conn)
@@ -0,0 +1,37 @@
+"""Stronicowanie po kluczu (keyset) dla długich list sortowanych po ``id``.
+
+Kolejna strona to ``WHERE id > cursor ORDER BY id LIMIT n`` (albo ``<`` i ``DESC``
+dla list od najnowszych), więc koszt zapytania nie rośnie z numerem strony jak przy OFFSET. Klient dostaje ``next_cursor``
+(``None`` na ostatniej stronie) i odsyła go w kolejnym żądaniu.
+"""
+from typing import Optional
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def paginate(db: Session, query: Select, key_column, limit: int, cursor: Optional[int] = None,
+             with_total: bool = False, descending: bool = False) -> dict:
+    """``query`` to projekcja kolumn zawierająca ``key_column`` pod jej nazwą; pozycje wracają jako dicty.
+
+    ``total`` liczone jest tylko na życzenie (osobny COUNT).
+    """
+    total = None
+    if with_total:
+        total = db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+    if cursor is not None:
+        query = query.where(key_column < cursor if descending else key_column > cursor)
+    order = key_column.desc() if descending else key_column
+    rows = [dict(row) for row in db.execute(query.order_by(order).limit(limit + 1)).mappings()]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": rows,
+        "next_cursor": rows[-1][key_column.key] if has_more else None,
+        "total": total,
+    }
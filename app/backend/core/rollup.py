@@ -0,0 +1,123 @@
+"""Utrzymanie agregatu ``dzienne_statystyki``.
+
+Rezerwacje dopisują się przyrostowo w swojej transakcji (``record_booking``),
+a ``rebuild`` odtwarza tabelę z całej historii wypożyczeń:
+
+    python -m app.backend.core.rollup
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.backend.modules.inventory import models as inv_models
+from app.backend.modules.rentals import models as rental_models
+
+_stats = rental_models.DzienneStatystyki.__table__
+
+
+def _bump(db, day: date, model_id: Optional[int], kategoria: Optional[str],
+          rentals: int, positions: int, revenue: Decimal) -> None:
+    key = (_stats.c.dzien == day,
+           _stats.c.model_id.is_(None) if model_id is None else _stats.c.model_id == model_id)
+    first_row = select(func.min(_stats.c.id)).where(*key).scalar_subquery()
+    result = db.execute(
+        update(_stats)
+        .where(_stats.c.id == first_row)
+        .values(
+            liczba_wypozyczen=_stats.c.liczba_wypozyczen + rentals,
+            liczba_pozycji=_stats.c.liczba_pozycji + positions,
+            przychod=_stats.c.przychod + revenue,
+        )
+    )
+    if result.rowcount == 0:
+        db.execute(insert(_stats).values(
+            dzien=day,
+            model_id=model_id,
+            kategoria=kategoria,
+            liczba_wypozyczen=rentals,
+            liczba_pozycji=positions,
+            przychod=revenue,
+        ))
+
+
+def record_booking(db, day: date, lines: list[tuple[int, Optional[str], int, Decimal]]) -> None:
+    """``lines`` to krotki (model_id, kategoria, liczba sztuk, przychód) jednej rezerwacji."""
+    _bump(db, day, None, None, 1, sum(line[2] for line in lines), sum(line[3] for line in lines))
+    for model_id, kategoria, qty, revenue in lines:
+        _bump(db, day, model_id, kategoria, 1, qty, revenue)
+
+
+def _rental_days(db, wyp):
+    """Liczba dni najmu jak w ``_create_booking``: różnica dat terminu, co najmniej 1."""
+    bind = db.get_bind() if isinstance(db, Session) else db
+    start, end = func.date(wyp.c.data_plan_wydania), func.date(wyp.c.data_plan_zwrotu)
+    if bind.dialect.name == "postgresql":
+        diff = end - start
+    else:
+        diff = func.julianday(end) - func.julianday(start)
+    return case((diff < 1, 1), else_=diff)
+
+
+def rebuild(db) -> None:
+    wyp = rental_models.Wypozyczenie.__table__
+    poz = rental_models.PozycjaWypozyczenia.__table__
+    egz = inv_models.EgzemplarzNarzedzia.__table__
+    mod = inv_models.ModelNarzedzia.__table__
+
+    day = func.date(wyp.c.data_rezerwacji)
+    positions_per_rental = (
+        select(poz.c.wypozyczenie_id, func.count(poz.c.id).label("n"))
+        .group_by(poz.c.wypozyczenie_id)
+        .subquery()
+    )
+
+    db.execute(delete(_stats))
+
+    db.execute(insert(_stats).from_select(
+        ["dzien", "liczba_wypozyczen", "liczba_pozycji", "przychod"],
+        select(
+            day,
+            func.count(wyp.c.id),
+            func.coalesce(func.sum(positions_per_rental.c.n), 0),
+            func.coalesce(func.sum(wyp.c.koszt_calkowity), 0),
+        )
+        .select_from(wyp.outerjoin(positions_per_rental, positions_per_rental.c.wypozyczenie_id == wyp.c.id))
+        .group_by(day),
+    ))
+
+    # Przychód pozycji liczymy jak record_booking (dni * cena_za_dobe); wypożyczenia
+    # bez terminu dostają proporcjonalną część koszt_calkowity
+    line_revenue = func.coalesce(
+        _rental_days(db, wyp) * mod.c.cena_za_dobe,
+        wyp.c.koszt_calkowity / positions_per_rental.c.n,
+    )
+    db.execute(insert(_stats).from_select(
+        ["dzien", "model_id", "kategoria", "liczba_wypozyczen", "liczba_pozycji", "przychod"],
+        select(
+            day,
+            egz.c.model_id,
+            mod.c.kategoria,
+            func.count(wyp.c.id.distinct()),
+            func.count(poz.c.id),
+            func.sum(line_revenue),
+        )
+        .select_from(
+            poz.join(wyp, wyp.c.id == poz.c.wypozyczenie_id)
+            .join(positions_per_rental, positions_per_rental.c.wypozyczenie_id == wyp.c.id)
+            .join(egz, egz.c.id == poz.c.egzemplarz_id)
+            .join(mod, mod.c.id == egz.c.model_id)
+        )
+        .group_by(day, egz.c.model_id, mod.c.kategoria),
+    ))
+
+
+if __name__ == "__main__":
+    from app.backend.core.database import SessionLocal
+
+    with SessionLocal() as session:
+        rebuild(session)
+        session.commit()
+    print("✅ Przebudowano tabelę dzienne_statystyki.")
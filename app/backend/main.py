@@ -1,12 +1,30 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.backend.api import router_users, router_inventory, router_rentals, router_analytics
+from app.backend.core.database import SessionLocal, engine
+from app.backend.core.migrations import run_migrations
+from app.backend.modules.rentals import occupancy
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    run_migrations(engine)
+    if occupancy.OCCUPANCY_INDEX_REQUESTED and not occupancy.OCCUPANCY_INDEX_ENABLED:
+        print("⚠️ OCCUPANCY_INDEX wyłączony: indeks zajętości wymaga WEB_CONCURRENCY=1.")
+    if occupancy.OCCUPANCY_INDEX_ENABLED:
+        with SessionLocal() as db:
+            occupancy.index.rebuild(db)
+    yield
+
 
 app = FastAPI(
     title="RentTool PRO API",
     description="System zarządzania wypożyczalnią narzędzi - Backend v1.0",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS - żeby Streamlit mógł bez problemu wołać API
@@ -0,0 +1,125 @@
+"""Liczniki egzemplarzy per model w tabeli ``stany_modeli``.
+
+Każda zmiana statusu lub stanu technicznego egzemplarza dopisuje w swojej
+transakcji różnice (``UPDATE ... SET kol = kol + delta``), więc katalog czyta
+jeden wiersz na model zamiast liczyć egzemplarze. ``reconcile`` przelicza
+liczniki od zera i poprawia rozjazdy:
+
+    python -m app.backend.modules.inventory.counters
+"""
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import case, func, insert, select, update
+
+from . import models
+
+COUNTER_COLUMNS = ("dostepne", "w_magazynie", "u_klienta", "w_warsztacie", "awaria", "wymaga_przegladu", "razem")
+
+# (status, stan_techniczny) egzemplarza; None = egzemplarz nie istnieje
+ItemState = Optional[tuple[str, str]]
+Deltas = dict[int, Counter]
+
+_counters = models.StanModelu.__table__
+_items = models.EgzemplarzNarzedzia.__table__
+
+
+def _vector(state: ItemState) -> Counter:
+    if state is None:
+        return Counter()
+    status, stan = state
+    return Counter({
+        "dostepne": int(status == "W_MAGAZYNIE" and stan == "SPRAWNY"),
+        "w_magazynie": int(status == "W_MAGAZYNIE"),
+        "u_klienta": int(status == "U_KLIENTA"),
+        "w_warsztacie": int(status == "W_WARSZTACIE"),
+        "awaria": int(stan == "AWARIA"),
+        "wymaga_przegladu": int(stan == "WYMAGA_PRZEGLADU"),
+        "razem": 1,
+    })
+
+
+def add_change(deltas: Deltas, model_id: int, before: ItemState, after: ItemState, n: int = 1) -> None:
+    delta = deltas.setdefault(model_id, Counter())
+    old, new = _vector(before), _vector(after)
+    for column in COUNTER_COLUMNS:
+        delta[column] += n * (new[column] - old[column])
+
+
+def apply(db, deltas: Deltas) -> None:
+    """Dopisuje różnice w bieżącej transakcji (commit należy do wołającego)."""
+    for model_id, delta in deltas.items():
+        values = {column: delta[column] for column in COUNTER_COLUMNS if delta[column]}
+        if not values:
+            continue
+        result = db.execute(
+            update(_counters)
+            .where(_counters.c.model_id == model_id)
+            .values({column: _counters.c[column] + value for column, value in values.items()})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(_counters).values(
+                model_id=model_id, **{column: delta[column] for column in COUNTER_COLUMNS},
+            ))
+
+
+def record_change(db, model_id: int, before: ItemState, after: ItemState, n: int = 1) -> None:
+    deltas: Deltas = {}
+    add_change(deltas, model_id, before, after, n)
+    apply(db, deltas)
+
+
+def item_state(item: models.EgzemplarzNarzedzia) -> ItemState:
+    return item.status, item.stan_techniczny
+
+
+def _expected(db) -> dict[int, tuple[int, ...]]:
+    status, stan = _items.c.status, _items.c.stan_techniczny
+    conditions = {
+        "dostepne": (status == "W_MAGAZYNIE") & (stan == "SPRAWNY"),
+        "w_magazynie": status == "W_MAGAZYNIE",
+        "u_klienta": status == "U_KLIENTA",
+        "w_warsztacie": status == "W_WARSZTACIE",
+        "awaria": stan == "AWARIA",
+        "wymaga_przegladu": stan == "WYMAGA_PRZEGLADU",
+    }
+    rows = db.execute(
+        select(
+            _items.c.model_id,
+            *(func.sum(case((conditions[column], 1), else_=0)) for column in COUNTER_COLUMNS[:-1]),
+            func.count(_items.c.id),
+        ).group_by(_items.c.model_id)
+    )
+    return {row[0]: tuple(int(value) for value in row[1:]) for row in rows}
+
+
+def reconcile(db) -> dict:
+    """Porównuje liczniki z egzemplarzami i nadpisuje rozbieżne wiersze."""
+    expected = _expected(db)
+    current = {
+        row[0]: tuple(row[1:])
+        for row in db.execute(select(_counters.c.model_id, *(_counters.c[column] for column in COUNTER_COLUMNS)))
+    }
+
+    fixed = 0
+    for model_id in expected.keys() | current.keys():
+        values = expected.get(model_id, (0,) * len(COUNTER_COLUMNS))
+        if current.get(model_id) == values:
+            continue
+        fixed += 1
+        row = dict(zip(COUNTER_COLUMNS, values))
+        if model_id in current:
+            db.execute(update(_counters).where(_counters.c.model_id == model_id).values(row))
+        else:
+            db.execute(insert(_counters).values(model_id=model_id, **row))
+
+    return {"modele": len(expected), "poprawione": fixed}
+
+
+if __name__ == "__main__":
+    from app.backend.core.database import SessionLocal
+
+    with SessionLocal() as session:
+        result = reconcile(session)
+        session.commit()
+    print(f"✅ Liczniki stany_modeli: poprawiono {result['poprawione']} z {result['modele']} modeli.")
@@ -1,14 +1,37 @@
 from __future__ import annotations
 
-import uuid
-from datetime import datetime
-
-from sqlalchemy import and_, func
+import csv
+import hashlib
+import io
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Union
+
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.backend.core import cache, pagination
 from app.backend.modules.rentals import models as rental_models
+from app.backend.modules.rentals import occupancy
+
+from . import counters, models, schemas, search as text_search
+
+CALENDAR_MAX_DAYS = 366
+IMPORT_LOOKUP_CHUNK = 1000
+BULK_ITEMS_MAX = 100_000
+IMPORT_MAX_ERRORS = 50
+
+
+_catalog_cache = cache.ResultCache("modele_narzedzi", "egzemplarze_narzedzi", maxsize=256, ttl=300)
+_catalog_adapter = TypeAdapter(list[schemas.ToolModelSummaryRead])
+
 
-from . import models, schemas
+class ImportValidationError(ValueError):
+    def __init__(self, errors: list[str]):
+        super().__init__(f"Import odrzucony - błędnych wierszy: {len(errors)}.")
+        self.errors = errors[:IMPORT_MAX_ERRORS]
 
 
 def create_tool_model(db: Session, payload: schemas.ToolModelCreate) -> models.ModelNarzedzia:
@@ -23,6 +46,7 @@ def create_tool_model(db: Session, payload: schemas.ToolModelCreate) -> models.M
     )
     db.add(model)
     db.commit()
+    cache.invalidate("modele_narzedzi")
     db.refresh(model)
     return model
 
@@ -36,6 +60,7 @@ def update_tool_model(db: Session, model_id: int, payload: schemas.ToolModelUpda
         setattr(model, field, value)
 
     db.commit()
+    cache.invalidate("modele_narzedzi")
     db.refresh(model)
     return model
 
@@ -54,6 +79,7 @@ def withdraw_tool_model(db: Session, model_id: int):
     if model:
         model.wycofany = True
         db.commit()
+        cache.invalidate("modele_narzedzi")
     return model
 
 
@@ -61,34 +87,24 @@ def list_models_with_available_counts(db: Session, search: str = None, category:
     from sqlalchemy import func, or_
     from app.backend.modules.inventory import models as inv_models
 
-    subquery = (
-        db.query(
-            inv_models.EgzemplarzNarzedzia.model_id,
-            func.count(inv_models.EgzemplarzNarzedzia.id).label("dostępne_sztuki"),
-        )
-        .filter(
-            inv_models.EgzemplarzNarzedzia.status == "W_MAGAZYNIE",
-            inv_models.EgzemplarzNarzedzia.stan_techniczny == "SPRAWNY",
-        )
-        .group_by(inv_models.EgzemplarzNarzedzia.model_id)
-        .subquery()
-    )
-
+    # Liczniki utrzymywane przy zmianach stanu (stany_modeli) - bez GROUP BY po egzemplarzach
     query = (
         db.query(
             inv_models.ModelNarzedzia,
-            func.coalesce(subquery.c.dostępne_sztuki, 0).label("liczba_sztuk"),
+            func.coalesce(inv_models.StanModelu.dostepne, 0).label("liczba_sztuk"),
         )
-        .outerjoin(subquery, inv_models.ModelNarzedzia.id == subquery.c.model_id)
+        .outerjoin(inv_models.StanModelu, inv_models.ModelNarzedzia.id == inv_models.StanModelu.model_id)
     )
 
     if search:
         query = query.filter(
             or_(
-                inv_models.ModelNarzedzia.nazwa_modelu.ilike(f"%{search}%"),
-                inv_models.ModelNarzedzia.producent.ilike(f"%{search}%"),
+                text_search.contains(db, inv_models.ModelNarzedzia.nazwa_modelu, search),
+                text_search.contains(db, inv_models.ModelNarzedzia.producent, search),
             )
-        )
+        ).order_by(*text_search.similarity_order(
+            db, search, inv_models.ModelNarzedzia.nazwa_modelu, inv_models.ModelNarzedzia.producent,
+        ))
 
     if category and category != "Wszystkie":
         query = query.filter(inv_models.ModelNarzedzia.kategoria == category)
@@ -96,119 +112,659 @@ def list_models_with_available_counts(db: Session, search: str = None, category:
     return query.all()
 
 
-def list_models_with_counts(db: Session, search: str = "", cat: str = "Wszystkie"):
-    count_subquery = (
-        db.query(
-            models.EgzemplarzNarzedzia.model_id,
-            func.count(models.EgzemplarzNarzedzia.id).label("total"),
+def _catalog_version(db: Session) -> tuple:
+    """Wersja katalogu ze stanu w bazie, wspólnego dla wszystkich workerów.
+
+    Każdy zapis modelu albo licznika ``stany_modeli`` podbija w bazie kolumnę
+    ``wersja`` (bez zegarów aplikacji), a liczba wierszy i max ID wyłapują
+    dodania i usunięcia.
+    """
+    mod, stan = models.ModelNarzedzia, models.StanModelu
+    return tuple(db.execute(select(
+        select(func.count(mod.id)).scalar_subquery(),
+        select(func.max(mod.id)).scalar_subquery(),
+        select(func.sum(mod.wersja)).scalar_subquery(),
+        select(func.count(stan.model_id)).scalar_subquery(),
+        select(func.sum(stan.wersja)).scalar_subquery(),
+    )).one())
+
+
+def get_catalog_payload(db: Session, search: str = None, category: str = None) -> tuple[str, bytes]:
+    """Zserializowany katalog i jego ETag (skrót treści, więc zgodny między workerami).
+
+    Cache procesu jest kluczowany wersją z bazy, więc zapis obsłużony przez inny
+    worker od razu unieważnia wpis także tutaj.
+    """
+    key = (search or None, category or None, _catalog_version(db))
+    entry = _catalog_cache.get(key)
+    if entry is None:
+        rows = list_models_with_available_counts(db, search=search, category=category)
+        payload = _catalog_adapter.validate_python(
+            [{"ModelNarzedzia": model, "liczba_sztuk": count} for model, count in rows], from_attributes=True,
         )
-        .group_by(models.EgzemplarzNarzedzia.model_id)
-        .subquery()
-    )
+        body = _catalog_adapter.dump_json(payload)
+        entry = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+        _catalog_cache.set(key, entry)
+    return entry
+
 
+def list_models_with_counts(db: Session, search: str = "", cat: str = "Wszystkie"):
     query = (
         db.query(
             models.ModelNarzedzia,
-            func.coalesce(count_subquery.c.total, 0).label("liczba_sztuk"),
+            func.coalesce(models.StanModelu.razem, 0).label("liczba_sztuk"),
         )
-        .outerjoin(count_subquery, models.ModelNarzedzia.id == count_subquery.c.model_id)
+        .outerjoin(models.StanModelu, models.ModelNarzedzia.id == models.StanModelu.model_id)
     )
 
     if search:
-        query = query.filter(models.ModelNarzedzia.nazwa_modelu.ilike(f"%{search}%"))
+        query = query.filter(text_search.contains(db, models.ModelNarzedzia.nazwa_modelu, search)).order_by(
+            *text_search.similarity_order(db, search, models.ModelNarzedzia.nazwa_modelu)
+        )
     if cat != "Wszystkie":
         query = query.filter(models.ModelNarzedzia.kategoria == cat)
 
     return query.filter(models.ModelNarzedzia.wycofany == False).all()
 
 
-def bulk_create_items(db: Session, model_id: int, count: int):
-    for _ in range(count):
-        temp_sn = f"SN-{uuid.uuid4().hex[:6].upper()}"
-        db_item = models.EgzemplarzNarzedzia(
-            model_id=model_id,
-            numer_seryjny=temp_sn,
-            status="W_MAGAZYNIE",
-            stan_techniczny="SPRAWNY",
+def _item_filters(db: Session, search=None, category=None, producer=None, location=None, tech_state=None) -> list:
+    # "Wszystkie"/"Wszyscy" to wartości domyślne selectboxów we frontendzie
+    filters = []
+    if search:
+        filters.append(
+            text_search.contains(db, models.ModelNarzedzia.nazwa_modelu, search)
+            | text_search.contains(db, models.EgzemplarzNarzedzia.numer_seryjny, search)
+        )
+    if category and category != "Wszystkie":
+        filters.append(models.ModelNarzedzia.kategoria == category)
+    if producer and producer != "Wszyscy":
+        filters.append(models.ModelNarzedzia.producent == producer)
+    if location and location != "Wszystkie":
+        filters.append(models.EgzemplarzNarzedzia.status == location)
+    if tech_state and tech_state != "Wszystkie":
+        filters.append(models.EgzemplarzNarzedzia.stan_techniczny == tech_state)
+    return filters
+
+
+def list_items(
+    db: Session,
+    search: str = None,
+    category: str = None,
+    producer: str = None,
+    location: str = None,
+    tech_state: str = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    cursor: Optional[int] = None,
+    with_total: bool = False,
+) -> dict:
+    """Płaskie wiersze egzemplarzy jedną projekcją kolumn - bez obiektów ORM i leniwego ładowania modeli."""
+    egz, mod = models.EgzemplarzNarzedzia, models.ModelNarzedzia
+    query = (
+        select(
+            egz.id,
+            mod.nazwa_modelu.label("model_name"),
+            mod.kategoria.label("category"),
+            mod.producent.label("producer"),
+            egz.numer_seryjny.label("sn"),
+            egz.stan_techniczny.label("stan"),
+            egz.status,
+            egz.licznik_wypozyczen.label("licznik"),
+        )
+        .join(mod, mod.id == egz.model_id)
+        .where(*_item_filters(db, search, category, producer, location, tech_state))
+    )
+    return pagination.paginate(db, query, models.EgzemplarzNarzedzia.id, limit, cursor, with_total)
+
+
+def _serial_number(model_id: int, n: int) -> str:
+    return f"SN-{model_id:04d}-{n:06d}"
+
+
+def bulk_create_items(db: Session, model_id: int, count: int) -> list[int]:
+    """Dostawa ``count`` sztuk jednym INSERT-em; zwraca ID nowych egzemplarzy.
+
+    Numery seryjne biorą się z licznika modelu: UPDATE ... RETURNING rezerwuje cały
+    blok, więc równoległe dostawy nie dostaną tych samych numerów. Rezerwacja jest
+    zatwierdzana osobno przed INSERT-em - gdy numer z bloku okaże się zajęty,
+    blok przepada, a ponowna próba dostaje kolejne numery zamiast tych samych.
+    """
+    counter = models.ModelNarzedzia.licznik_numerow
+    last = db.execute(
+        update(models.ModelNarzedzia)
+        .where(models.ModelNarzedzia.id == model_id)
+        .values(licznik_numerow=counter + count)
+        .returning(counter)
+    ).scalar()
+    if last is None:
+        db.rollback()
+        raise ValueError("Model narzędzia nie istnieje.")
+    db.commit()
+
+    rows = [
+        {
+            "model_id": model_id,
+            "numer_seryjny": _serial_number(model_id, n),
+            "status": "W_MAGAZYNIE",
+            "stan_techniczny": "SPRAWNY",
+            "licznik_wypozyczen": 0,
+        }
+        for n in range(last - count + 1, last + 1)
+    ]
+    try:
+        item_ids = db.execute(
+            insert(models.EgzemplarzNarzedzia).returning(models.EgzemplarzNarzedzia.id, sort_by_parameter_order=True),
+            rows,
+        ).scalars().all()
+        counters.record_change(db, model_id, None, ("W_MAGAZYNIE", "SPRAWNY"), n=count)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError("Numer seryjny z tej puli jest już zajęty - pula została pominięta, spróbuj ponownie.")
+    cache.invalidate("modele_narzedzi", "egzemplarze_narzedzi")
+    return item_ids
+
+
+ModelKey = Union[int, tuple[str, str]]
+
+
+def _chunks(values: list, size: int = IMPORT_LOOKUP_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _describe_validation_error(exc: ValidationError) -> str:
+    return "; ".join(f"{err['loc'][0]}: {err['msg']}" for err in exc.errors())
+
+
+def _import_model_key(row: dict, new_models: dict) -> ModelKey:
+    if row.get("model_id"):
+        if not row["model_id"].isdigit():
+            raise ValueError("model_id musi być liczbą")
+        return int(row["model_id"])
+
+    producent, nazwa = row.get("producent"), row.get("nazwa_modelu")
+    if not producent or not nazwa:
+        raise ValueError("podaj model_id albo producent i nazwa_modelu")
+
+    key = (producent, nazwa)
+    if row.get("cena_za_dobe") and key not in new_models:
+        new_models[key] = schemas.ToolModelCreate(
+            producent=producent,
+            nazwa_modelu=nazwa,
+            kategoria=row.get("kategoria"),
+            opis=row.get("opis"),
+            cena_za_dobe=row["cena_za_dobe"].replace(",", "."),
+            # Katalog i widoki zakładają liczbową kaucję
+            kaucja=(row.get("kaucja") or "0").replace(",", "."),
+        )
+    return key
+
+
+def _parse_purchase_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"niepoprawna data_zakupu {value} (oczekiwano RRRR-MM-DD)") from None
+
+
+def _read_import_rows(content: str):
+    sample = content[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(content), dialect=dialect)
+    for line, row in enumerate(reader, start=2):
+        yield line, {key.strip().lower(): (value or "").strip() or None for key, value in row.items() if key}
+
+
+def import_inventory_csv(db: Session, content: str) -> dict:
+    """Import modeli i egzemplarzy z pliku CSV w jednej transakcji (wszystko albo nic).
+
+    Kolumny: ``numer_seryjny``, ``model_id`` albo ``producent`` + ``nazwa_modelu``,
+    opcjonalnie ``data_zakupu``. Nieznany model zostanie utworzony, jeśli wiersz ma
+    ``cena_za_dobe`` (oraz ``kategoria``, ``kaucja``, ``opis``). Wiersz bez numeru
+    seryjnego dopisuje sam model.
+    """
+    errors: list[tuple[int, str]] = []
+    new_models: dict[tuple[str, str], schemas.ToolModelCreate] = {}
+    key_lines: dict[ModelKey, int] = {}
+    serial_lines: dict[str, int] = {}
+    items: list[tuple[ModelKey, str, Optional[datetime]]] = []
+
+    for line, row in _read_import_rows(content):
+        try:
+            key = _import_model_key(row, new_models)
+            key_lines.setdefault(key, line)
+
+            serial = row.get("numer_seryjny")
+            if not serial:
+                continue
+            if len(serial) > 50:
+                raise ValueError("numer_seryjny dłuższy niż 50 znaków")
+            if serial in serial_lines:
+                raise ValueError(f"numer seryjny {serial} powtarza się (wiersz {serial_lines[serial]})")
+            serial_lines[serial] = line
+            items.append((key, serial, _parse_purchase_date(row.get("data_zakupu"))))
+        except ValidationError as exc:
+            errors.append((line, _describe_validation_error(exc)))
+        except ValueError as exc:
+            errors.append((line, str(exc)))
+
+    if not key_lines and not errors:
+        raise ValueError("Plik nie zawiera żadnych wierszy.")
+
+    # Rozwiązanie modeli: po ID i po parze (producent, nazwa) - zapytaniami po IN
+    resolved: dict[ModelKey, int] = {}
+    model_ids = [key for key in key_lines if isinstance(key, int)]
+    for chunk in _chunks(model_ids):
+        for model_id in db.scalars(select(models.ModelNarzedzia.id).where(models.ModelNarzedzia.id.in_(chunk))):
+            resolved[model_id] = model_id
+
+    name_keys = [key for key in key_lines if isinstance(key, tuple)]
+    for chunk in _chunks(name_keys):
+        rows = db.execute(
+            select(models.ModelNarzedzia.id, models.ModelNarzedzia.producent, models.ModelNarzedzia.nazwa_modelu)
+            .where(tuple_(models.ModelNarzedzia.producent, models.ModelNarzedzia.nazwa_modelu).in_(chunk))
+            .order_by(models.ModelNarzedzia.id.desc())
+        )
+        for model_id, producent, nazwa in rows:
+            resolved[(producent, nazwa)] = model_id
+
+    to_create = [key for key in name_keys if key not in resolved and key in new_models]
+    for key, line in key_lines.items():
+        if key not in resolved and key not in new_models:
+            label = f"ID {key}" if isinstance(key, int) else " ".join(key)
+            errors.append((line, f"nieznany model {label} (podaj cena_za_dobe, aby go utworzyć)"))
+
+    serials = list(serial_lines)
+    for chunk in _chunks(serials):
+        for serial in db.scalars(
+            select(models.EgzemplarzNarzedzia.numer_seryjny)
+            .where(models.EgzemplarzNarzedzia.numer_seryjny.in_(chunk))
+        ):
+            errors.append((serial_lines[serial], f"numer seryjny {serial} już istnieje w bazie"))
+
+    if errors:
+        raise ImportValidationError([f"Wiersz {line}: {message}" for line, message in sorted(errors)])
+
+    if to_create:
+        created = db.execute(
+            insert(models.ModelNarzedzia).returning(
+                models.ModelNarzedzia.id, sort_by_parameter_order=True,
+            ),
+            [{**new_models[key].model_dump(), "wycofany": False} for key in to_create],
         )
-        db.add(db_item)
+        resolved.update(zip(to_create, created.scalars()))
+
+    if items:
+        db.execute(
+            insert(models.EgzemplarzNarzedzia),
+            [
+                {
+                    "model_id": resolved[key],
+                    "numer_seryjny": serial,
+                    "data_zakupu": bought,
+                    "status": "W_MAGAZYNIE",
+                    "stan_techniczny": "SPRAWNY",
+                    "licznik_wypozyczen": 0,
+                }
+                for key, serial, bought in items
+            ],
+        )
+        deltas: counters.Deltas = {}
+        for key, _, _ in items:
+            counters.add_change(deltas, resolved[key], None, ("W_MAGAZYNIE", "SPRAWNY"))
+        counters.apply(db, deltas)
     db.commit()
+    cache.invalidate("modele_narzedzi", "egzemplarze_narzedzi")
+
+    return {"modele_dodane": len(to_create), "egzemplarze_dodane": len(items)}
 
 
 def update_technical_state(db: Session, item_id: int, new_state: str):
     item = db.get(models.EgzemplarzNarzedzia, item_id)
     if item:
         if new_state in ["SPRAWNY", "AWARIA", "WYMAGA_PRZEGLADU"]:
+            before = counters.item_state(item)
             item.stan_techniczny = new_state
+            counters.record_change(db, item.model_id, before, counters.item_state(item))
             db.commit()
+            cache.invalidate("egzemplarze_narzedzi")
     return item
 
 
 def mark_for_inspection(db: Session, item_id: int):
     item = db.get(models.EgzemplarzNarzedzia, item_id)
     if item:
+        before = counters.item_state(item)
         item.stan_techniczny = "WYMAGA_PRZEGLADU"
         item.status = "W_WARSZTACIE"
+        counters.record_change(db, item.model_id, before, counters.item_state(item))
         db.commit()
+        cache.invalidate("egzemplarze_narzedzi")
     return item
 
 
 def receive_from_service(db: Session, item_id: int, warehouse_id: int = 1):
     item = db.get(models.EgzemplarzNarzedzia, item_id)
     if item and item.status == "W_WARSZTACIE":
+        before = counters.item_state(item)
         item.status = "W_MAGAZYNIE"
         item.stan_techniczny = "SPRAWNY"
         item.licznik_wypozyczen = 0
         item.warsztat_id = None
         item.magazyn_id = warehouse_id
+        counters.record_change(db, item.model_id, before, counters.item_state(item))
         db.commit()
+        cache.invalidate("egzemplarze_narzedzi")
     return item
 
 
 def send_to_service(db: Session, item_id: int, workshop_id: int = 1):
     item = db.get(models.EgzemplarzNarzedzia, item_id)
     if item:
+        before = counters.item_state(item)
         item.status = "W_WARSZTACIE"
         item.magazyn_id = None
         item.warsztat_id = workshop_id
+        counters.record_change(db, item.model_id, before, counters.item_state(item))
         db.commit()
+        cache.invalidate("egzemplarze_narzedzi")
     return item
 
 
+# Statusy, z których wolno przejść w operacjach zbiorczych
+BULK_STATE_STATUSES = ("W_MAGAZYNIE", "W_WARSZTACIE")
+
+
+def _bulk_transition(db: Session, item_ids: list[int], allowed_statuses, values: dict, reason: str) -> dict:
+    """Jedno przejście dla wielu egzemplarzy: blokada wierszy, jeden UPDATE ze strażnikiem statusu.
+
+    Egzemplarze, których nie ma albo których status nie pozwala na przejście,
+    trafiają do ``odrzucone`` z powodem; pozostałe zmieniają się w jednej transakcji.
+    """
+    items = models.EgzemplarzNarzedzia
+    ids = list(dict.fromkeys(item_ids))
+    locked = {
+        row.id: row
+        for row in db.execute(
+            select(items.id, items.model_id, items.status, items.stan_techniczny)
+            .where(items.id.in_(ids))
+            .with_for_update()
+        )
+    }
+
+    eligible = [item_id for item_id in ids if item_id in locked and locked[item_id].status in allowed_statuses]
+    changed = set()
+    if eligible:
+        changed = set(db.execute(
+            update(items)
+            .where(items.id.in_(eligible), items.status.in_(allowed_statuses))
+            .values(values)
+            .returning(items.id)
+        ).scalars())
+
+    deltas: counters.Deltas = {}
+    rejected = []
+    for item_id in ids:
+        row = locked.get(item_id)
+        if row is None:
+            rejected.append({"id": item_id, "powod": "egzemplarz nie istnieje"})
+        elif item_id not in changed:
+            rejected.append({"id": item_id, "powod": f"{reason} (status: {row.status})"})
+        else:
+            after = (values.get("status", row.status), values.get("stan_techniczny", row.stan_techniczny))
+            counters.add_change(deltas, row.model_id, (row.status, row.stan_techniczny), after)
+    counters.apply(db, deltas)
+    db.commit()
+    if changed:
+        cache.invalidate("egzemplarze_narzedzi")
+
+    return {"zmienione": [item_id for item_id in ids if item_id in changed], "odrzucone": rejected}
+
+
+def bulk_update_technical_state(db: Session, item_ids: list[int], new_state: str) -> dict:
+    return _bulk_transition(
+        db, item_ids, BULK_STATE_STATUSES, {"stan_techniczny": new_state},
+        "stan zmienia się tylko w magazynie lub warsztacie",
+    )
+
+
+def bulk_send_to_service(db: Session, item_ids: list[int], workshop_id: int = 1) -> dict:
+    return _bulk_transition(
+        db, item_ids, ("W_MAGAZYNIE",),
+        {"status": "W_WARSZTACIE", "magazyn_id": None, "warsztat_id": workshop_id},
+        "do serwisu przekazujemy tylko egzemplarze z magazynu",
+    )
+
+
+def bulk_receive_from_service(db: Session, item_ids: list[int], warehouse_id: int = 1) -> dict:
+    return _bulk_transition(
+        db, item_ids, ("W_WARSZTACIE",),
+        {
+            "status": "W_MAGAZYNIE",
+            "stan_techniczny": "SPRAWNY",
+            "licznik_wypozyczen": 0,
+            "warsztat_id": None,
+            "magazyn_id": warehouse_id,
+        },
+        "egzemplarz nie jest w warsztacie",
+    )
+
+
 def count_physical_in_stock(db: Session, model_id: int):
+    return db.scalar(
+        select(models.StanModelu.dostepne).where(models.StanModelu.model_id == model_id)
+    ) or 0
+
+
+def reconcile_model_counters(db: Session) -> dict:
+    result = counters.reconcile(db)
+    db.commit()
+    if result["poprawione"]:
+        cache.invalidate("egzemplarze_narzedzi")
+    return result
+
+
+def _functional_items_filter():
     return (
-        db.query(models.EgzemplarzNarzedzia)
-        .filter(
-            models.EgzemplarzNarzedzia.model_id == model_id,
-            models.EgzemplarzNarzedzia.status == "W_MAGAZYNIE",
-            models.EgzemplarzNarzedzia.stan_techniczny == "SPRAWNY",
+        models.EgzemplarzNarzedzia.stan_techniczny == "SPRAWNY",
+        models.EgzemplarzNarzedzia.status != "W_WARSZTACIE",
+    )
+
+
+def _not_booked_in_term(start_dt: datetime, end_dt: datetime):
+    """Warunek NOT EXISTS: egzemplarz nie ma aktywnej pozycji nachodzącej na termin."""
+    booked = (
+        select(rental_models.PozycjaWypozyczenia.id)
+        .join(rental_models.Wypozyczenie)
+        .where(
+            rental_models.PozycjaWypozyczenia.egzemplarz_id == models.EgzemplarzNarzedzia.id,
+            rental_models.Wypozyczenie.status.in_(rental_models.ACTIVE_RENTAL_STATUSES),
+            rental_models.Wypozyczenie.data_plan_wydania <= end_dt,
+            rental_models.Wypozyczenie.data_plan_zwrotu >= start_dt,
         )
-        .count()
     )
+    return ~booked.exists()
 
 
-def get_available_items_for_term(db: Session, model_id: int, start_dt: datetime, end_dt: datetime):
-    all_functional = (
-        db.query(models.EgzemplarzNarzedzia)
-        .filter(
+def _available_ids_from_index(db: Session, model_id: int, start_dt: datetime, end_dt: datetime) -> list[int]:
+    functional_ids = db.scalars(
+        select(models.EgzemplarzNarzedzia.id)
+        .where(models.EgzemplarzNarzedzia.model_id == model_id, *_functional_items_filter())
+        .order_by(models.EgzemplarzNarzedzia.id)
+    )
+    busy = occupancy.index.busy_item_ids(model_id, start_dt, end_dt)
+    return [item_id for item_id in functional_ids if item_id not in busy]
+
+
+def count_available_items_for_term(db: Session, model_id: int, start_dt: datetime, end_dt: datetime) -> int:
+    if occupancy.index.usable(db):
+        return len(_available_ids_from_index(db, model_id, start_dt, end_dt))
+
+    return db.scalar(
+        select(func.count(models.EgzemplarzNarzedzia.id)).where(
             models.EgzemplarzNarzedzia.model_id == model_id,
-            models.EgzemplarzNarzedzia.stan_techniczny == "SPRAWNY",
-            models.EgzemplarzNarzedzia.status != "W_WARSZTACIE",
+            *_functional_items_filter(),
+            _not_booked_in_term(start_dt, end_dt),
         )
-        .all()
     )
 
-    busy_items_query = (
-        db.query(rental_models.PozycjaWypozyczenia.egzemplarz_id)
-        .join(rental_models.Wypozyczenie)
-        .filter(
-            rental_models.Wypozyczenie.status.in_(["REZERWACJA", "WYDANE"]),
-            and_(
-                rental_models.Wypozyczenie.data_plan_wydania <= end_dt,
-                rental_models.Wypozyczenie.data_plan_zwrotu >= start_dt,
-            ),
+
+def count_available_items_for_models(
+    db: Session,
+    model_ids: list[int],
+    start_dt: datetime,
+    end_dt: datetime,
+) -> dict[int, int]:
+    rows = db.execute(
+        select(models.EgzemplarzNarzedzia.model_id, func.count(models.EgzemplarzNarzedzia.id))
+        .where(
+            models.EgzemplarzNarzedzia.model_id.in_(model_ids),
+            *_functional_items_filter(),
+            _not_booked_in_term(start_dt, end_dt),
         )
+        .group_by(models.EgzemplarzNarzedzia.model_id)
     )
+    counts = dict(rows.all())
+    return {model_id: counts.get(model_id, 0) for model_id in model_ids}
+
+
+def get_available_item_ids_for_term(
+    db: Session,
+    model_id: int,
+    start_dt: datetime,
+    end_dt: datetime,
+    limit: Optional[int] = None,
+    lock: bool = False,
+) -> list[int]:
+    """Przy ``lock=True`` wiersze egzemplarzy są blokowane (FOR UPDATE SKIP LOCKED),
+    a sztuki trzymane przez równoległe rezerwacje są pomijane zamiast na nie czekać."""
+    if not lock and occupancy.index.usable(db):
+        return _available_ids_from_index(db, model_id, start_dt, end_dt)[:limit]
 
-    busy_ids = [r[0] for r in busy_items_query.all()]
-    return [item for item in all_functional if item.id not in busy_ids]
+    query = (
+        select(models.EgzemplarzNarzedzia.id)
+        .where(
+            models.EgzemplarzNarzedzia.model_id == model_id,
+            *_functional_items_filter(),
+            _not_booked_in_term(start_dt, end_dt),
+        )
+        .order_by(models.EgzemplarzNarzedzia.id)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    if lock:
+        query = query.with_for_update(skip_locked=True, of=models.EgzemplarzNarzedzia)
+    return list(db.scalars(query))
+
+
+def get_availability_calendar(db: Session, model_id: int, date_from: date, date_to: date) -> list[dict]:
+    days = (date_to - date_from).days + 1
+    if days <= 0:
+        raise ValueError("Data końcowa nie może być wcześniejsza niż początkowa.")
+    if days > CALENDAR_MAX_DAYS:
+        raise ValueError(f"Kalendarz obejmuje maksymalnie {CALENDAR_MAX_DAYS} dni.")
+
+    functional = db.scalar(
+        select(func.count(models.EgzemplarzNarzedzia.id)).where(
+            models.EgzemplarzNarzedzia.model_id == model_id,
+            *_functional_items_filter(),
+        )
+    )
+
+    bookings = db.execute(
+        select(rental_models.Wypozyczenie.data_plan_wydania, rental_models.Wypozyczenie.data_plan_zwrotu)
+        .join(rental_models.PozycjaWypozyczenia)
+        .join(models.EgzemplarzNarzedzia,
+              models.EgzemplarzNarzedzia.id == rental_models.PozycjaWypozyczenia.egzemplarz_id)
+        .where(
+            models.EgzemplarzNarzedzia.model_id == model_id,
+            *_functional_items_filter(),
+            rental_models.Wypozyczenie.status.in_(rental_models.ACTIVE_RENTAL_STATUSES),
+            rental_models.Wypozyczenie.data_plan_wydania <= datetime.combine(date_to, time.max),
+            rental_models.Wypozyczenie.data_plan_zwrotu >= datetime.combine(date_from, time.min),
+        )
+    ).all()
+
+    # Sweep line: +1 w dniu wydania, -1 dzień po zwrocie, suma narastająca = zajęte sztuki
+    delta = np.zeros(days + 1, dtype=np.int64)
+    if bookings:
+        starts, ends = np.array(bookings, dtype="datetime64[D]").T
+        origin = np.datetime64(date_from, "D")
+        start_idx = np.clip((starts - origin).astype(np.int64), 0, days)
+        end_idx = np.clip((ends - origin).astype(np.int64) + 1, 0, days)
+        np.add.at(delta, start_idx, 1)
+        np.add.at(delta, end_idx, -1)
+    busy = np.cumsum(delta[:-1])
+    free = np.maximum(functional - busy, 0)
+
+    return [
+        {"date": (date_from + timedelta(days=offset)).isoformat(), "count": int(count)}
+        for offset, count in enumerate(free)
+    ]
+
+
+def find_next_available_window(db: Session, model_id: int, qty: int, duration_days: int, after: date) -> Optional[dict]:
+    """Najwcześniejszy termin [start, start + duration_days], w którym wolnych jest ``qty`` sztuk.
+
+    Dla każdego egzemplarza z posortowanych rezerwacji wyznaczamy luki, a z nich
+    przedziały dni, w których termin może się zacząć. Potem jeden przebieg po
+    posortowanych zdarzeniach otwarcia/zamknięcia takich przedziałów.
+    """
+    item_ids = list(db.scalars(
+        select(models.EgzemplarzNarzedzia.id)
+        .where(models.EgzemplarzNarzedzia.model_id == model_id, *_functional_items_filter())
+    ))
+    if len(item_ids) < qty:
+        return None
+
+    bookings = db.execute(
+        select(
+            rental_models.PozycjaWypozyczenia.egzemplarz_id,
+            rental_models.Wypozyczenie.data_plan_wydania,
+            rental_models.Wypozyczenie.data_plan_zwrotu,
+        )
+        .join(rental_models.Wypozyczenie)
+        .where(
+            rental_models.PozycjaWypozyczenia.egzemplarz_id.in_(item_ids),
+            rental_models.Wypozyczenie.status.in_(rental_models.ACTIVE_RENTAL_STATUSES),
+            # Tak jak w _not_booked_in_term: wypożyczenia bez planowanego terminu nie blokują sztuk
+            rental_models.Wypozyczenie.data_plan_wydania.is_not(None),
+            rental_models.Wypozyczenie.data_plan_zwrotu.is_not(None),
+            rental_models.Wypozyczenie.data_plan_zwrotu >= datetime.combine(after, time.min),
+        )
+        .order_by(rental_models.PozycjaWypozyczenia.egzemplarz_id, rental_models.Wypozyczenie.data_plan_wydania)
+    ).all()
+
+    by_item = {item_id: [] for item_id in item_ids}
+    for item_id, start, end in bookings:
+        by_item[item_id].append((start.date(), end.date()))
+
+    # (dzień, zmiana): -1 sortuje się przed +1, więc zamknięcia danego dnia liczą się pierwsze
+    events = []
+    for intervals in by_item.values():
+        cursor = after
+        for start, end in intervals:
+            last_start = start - timedelta(days=duration_days + 1)
+            if last_start >= cursor:
+                events.append((cursor, 1))
+                events.append((last_start + timedelta(days=1), -1))
+            cursor = max(cursor, end + timedelta(days=1))
+        events.append((cursor, 1))
+    events.sort()
+
+    free = 0
+    for idx, (day, change) in enumerate(events):
+        free += change
+        next_day = events[idx + 1][0] if idx + 1 < len(events) else None
+        if next_day != day and free >= qty:
+            return {
+                "start_dt": datetime.combine(day, time.min).isoformat(),
+                "end_dt": datetime.combine(day + timedelta(days=duration_days), time.max).isoformat(),
+                "count": free,
+            }
+    return None
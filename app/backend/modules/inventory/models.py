@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 from decimal import Decimal
-from sqlalchemy import String, ForeignKey, Text, Numeric, CheckConstraint, Boolean
+from sqlalchemy import String, ForeignKey, Text, Numeric, CheckConstraint, Boolean, Index, literal_column
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.backend.core.database import Base, TimestampMixin
 
@@ -33,6 +33,10 @@ class ModelNarzedzia(Base, TimestampMixin):
     cena_za_dobe: Mapped[Decimal] = mapped_column(Numeric(10, 2))
     kaucja: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 2))
     wycofany: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Ostatni numer nadany w numerach seryjnych SN-<model>-<n>
+    licznik_numerow: Mapped[int] = mapped_column(default=0)
+    # Licznik zapisów podbijany przez bazę w każdym UPDATE - z niego liczona jest wersja katalogu
+    wersja: Mapped[int] = mapped_column(default=0, onupdate=literal_column("wersja") + 1)
 
     egzemplarze: Mapped[List["EgzemplarzNarzedzia"]] = relationship(back_populates="model")
     opinie: Mapped[List["Opinia"]] = relationship(back_populates="model", cascade="all, delete-orphan")
@@ -53,6 +57,7 @@ class EgzemplarzNarzedzia(Base):
     __table_args__ = (
         CheckConstraint("NOT (magazyn_id IS NOT NULL AND warsztat_id IS NOT NULL)",
                         name="ck_egzemplarz_magazyn_xor_warsztat"),
+        Index("ix_egzemplarze_model_stan", "model_id", "stan_techniczny", "status"),
     )
 
     model: Mapped["ModelNarzedzia"] = relationship(back_populates="egzemplarze")
@@ -61,3 +66,18 @@ class EgzemplarzNarzedzia(Base):
     pozycje_wypozyczenia: Mapped[List["PozycjaWypozyczenia"]] = relationship(back_populates="egzemplarz")
     historia_serwisowa: Mapped[List["CzynnoscSerwisowa"]] = relationship(back_populates="egzemplarz",
                                                                          cascade="all, delete-orphan")
+
+
+class StanModelu(Base):
+    """Zdenormalizowane liczniki egzemplarzy modelu, utrzymywane przez ``counters.apply``."""
+    __tablename__ = "stany_modeli"
+    model_id: Mapped[int] = mapped_column(ForeignKey("modele_narzedzi.id"), primary_key=True)
+    dostepne: Mapped[int] = mapped_column(default=0)
+    w_magazynie: Mapped[int] = mapped_column(default=0)
+    u_klienta: Mapped[int] = mapped_column(default=0)
+    w_warsztacie: Mapped[int] = mapped_column(default=0)
+    awaria: Mapped[int] = mapped_column(default=0)
+    wymaga_przegladu: Mapped[int] = mapped_column(default=0)
+    razem: Mapped[int] = mapped_column(default=0)
+    # Jak ModelNarzedzia.wersja - podbijana przy każdej zmianie liczników
+    wersja: Mapped[int] = mapped_column(default=0, onupdate=literal_column("wersja") + 1)
@@ -1,10 +1,11 @@
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from decimal import Decimal
 from datetime import datetime
 from pydantic import BaseModel, Field, ConfigDict
 from app.backend.core.schemas import ORMBase
 
 ToolItemStatus = Literal["W_MAGAZYNIE", "W_WARSZTACIE", "U_KLIENTA", "WYCOFANY"]
+ToolTechState = Literal["SPRAWNY", "AWARIA", "WYMAGA_PRZEGLADU"]
 
 
 class ToolModelCreate(BaseModel):
@@ -50,3 +51,32 @@ class ToolModelSummaryRead(BaseModel):
     liczba_sztuk: int
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class AvailabilityBatchRequest(BaseModel):
+    model_ids: List[int] = Field(..., min_length=1, max_length=500)
+    start_dt: datetime
+    end_dt: datetime
+
+
+class BulkItemsRequest(BaseModel):
+    item_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+class BulkStateRequest(BulkItemsRequest):
+    new_state: ToolTechState
+
+
+class BulkItemRejection(BaseModel):
+    id: int
+    powod: str
+
+
+class BulkTransitionRead(BaseModel):
+    zmienione: List[int]
+    odrzucone: List[BulkItemRejection]
+
+
+class ModelAvailabilityRead(BaseModel):
+    model_id: int
+    count: int
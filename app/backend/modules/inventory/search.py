@@ -0,0 +1,133 @@
+"""Wyszukiwanie fraz w nazwach modeli, producentach i numerach seryjnych.
+
+PostgreSQL: ``ILIKE '%fraza%'`` korzysta z indeksów GIN ``pg_trgm`` (zakłada je
+migracja ``_search_indexes``), a katalog sortujemy po ``similarity()``.
+SQLite: indeks trigramów trzymany w pamięci procesu zawęża kandydatów do listy ID.
+Indeks budowany jest leniwie dla kolumny i kluczowany znacznikiem tabeli
+(liczba wierszy, max ID, max ``data_modyfikacji``) sprawdzanym przy każdym
+użyciu, więc zapisy z innych workerów też go unieważniają. ``cache.invalidate``
+czyści go w bieżącym procesie, a krótki TTL łapie zmiany bez śladu w znaczniku.
+"""
+from typing import Optional
+
+from sqlalchemy import case, func, select, text
+from sqlalchemy.orm import Session
+
+from app.backend.core.cache import ResultCache
+
+# (nazwa indeksu, tabela, kolumna)
+TRGM_INDEXES = [
+    ("ix_modele_nazwa_trgm", "modele_narzedzi", "nazwa_modelu"),
+    ("ix_modele_producent_trgm", "modele_narzedzi", "producent"),
+    ("ix_egzemplarze_numer_trgm", "egzemplarze_narzedzi", "numer_seryjny"),
+]
+
+# Krótsze frazy nie mają trigramów - zostaje zwykłe ILIKE
+MIN_TERM_LENGTH = 3
+# Mało selektywna fraza: lista ID byłaby dłuższa niż skan
+MAX_CANDIDATES = 5000
+MAX_RANKED = 500
+
+_trgm_enabled: Optional[bool] = None
+_indexes = {
+    "modele_narzedzi": ResultCache("modele_narzedzi", maxsize=4, ttl=60),
+    "egzemplarze_narzedzi": ResultCache("egzemplarze_narzedzi", maxsize=4, ttl=60),
+}
+
+
+def trigrams(value: str) -> set[str]:
+    value = value.lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self, rows):
+        self._texts: dict[int, str] = {}
+        self._postings: dict[str, set[int]] = {}
+        for row_id, value in rows:
+            if not value:
+                continue
+            self._texts[row_id] = value.lower()
+            for gram in trigrams(value):
+                self._postings.setdefault(gram, set()).add(row_id)
+
+    def search(self, term: str) -> set[int]:
+        grams = trigrams(term)
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0]).intersection(*postings[1:])
+        # Wspólne trigramy nie gwarantują ciągłego podciągu
+        needle = term.lower()
+        return {row_id for row_id in candidates if needle in self._texts[row_id]}
+
+    def similarity(self, row_id: int, term: str) -> float:
+        """Jak pg_trgm: |część wspólna| / |suma| zbiorów trigramów."""
+        grams, target = trigrams(term), trigrams(self._texts.get(row_id, ""))
+        return len(grams & target) / len(grams | target) if grams or target else 0.0
+
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _trigram_support(db: Session) -> bool:
+    global _trgm_enabled
+    if _trgm_enabled is None:
+        _trgm_enabled = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    return _trgm_enabled
+
+
+def _table_marker(db: Session, model) -> tuple:
+    """Tani odcisk stanu tabeli - zmienia się po INSERT/DELETE i zapisie przez ORM."""
+    columns = [func.count(model.id), func.max(model.id)]
+    if hasattr(model, "data_modyfikacji"):
+        columns.append(func.max(model.data_modyfikacji))
+    return tuple(db.execute(select(*columns)).one())
+
+
+def _index_for(db: Session, column) -> TrigramIndex:
+    model = column.class_
+    cache = _indexes[model.__table__.name]
+    key = (column.key, _table_marker(db, model))
+    index = cache.get(key)
+    if index is None:
+        index = TrigramIndex(db.execute(select(model.id, column)))
+        cache.set(key, index)
+    return index
+
+
+def _matching_ids(db: Session, column, term: str) -> Optional[set[int]]:
+    """ID wierszy z frazą w ``column`` albo ``None``, gdy lepiej zapytać bazę wprost."""
+    if _is_postgres(db) or len(term) < MIN_TERM_LENGTH:
+        return None
+    ids = _index_for(db, column).search(term)
+    return ids if len(ids) <= MAX_CANDIDATES else None
+
+
+def contains(db: Session, column, term: str):
+    """Warunek "kolumna zawiera frazę" (bez rozróżniania wielkości liter)."""
+    ids = _matching_ids(db, column, term)
+    if ids is None:
+        return column.ilike(f"%{term}%")
+    return column.class_.id.in_(ids)
+
+
+def similarity_order(db: Session, term: str, *columns) -> list:
+    """Klauzule ORDER BY: najpierw wiersze najbardziej podobne do frazy."""
+    if _is_postgres(db):
+        if not _trigram_support(db):
+            return []
+        return [func.greatest(*(func.similarity(column, term) for column in columns)).desc()]
+
+    scores: dict[int, float] = {}
+    for column in columns:
+        ids = _matching_ids(db, column, term)
+        if ids is None or len(ids) > MAX_RANKED:
+            return []
+        index = _index_for(db, column)
+        for row_id in ids:
+            scores[row_id] = max(scores.get(row_id, 0.0), index.similarity(row_id, term))
+    if not scores:
+        return []
+    return [case(scores, value=columns[0].class_.id, else_=0.0).desc()]
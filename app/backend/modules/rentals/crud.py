@@ -1,80 +1,353 @@
 from __future__ import annotations
 
-from datetime import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
 from typing import Optional
 
+from sqlalchemy import bindparam, case, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
 
+from app.backend.core import cache, pagination, rollup
+from app.backend.modules.inventory import counters
 from app.backend.modules.inventory import crud as inv_crud
 from app.backend.modules.inventory import models as inv_models
+from app.backend.modules.inventory import search as text_search
 from app.backend.modules.rentals import models as rent_models
 from app.backend.modules.users import models as user_models
 
-from . import models
+from . import models, occupancy, schemas
 
 
-def create_reservation(db: Session, client_id: int, model_id: int, qty: int, start_dt: datetime, end_dt: datetime):
-    available = inv_crud.get_available_items_for_term(db, model_id, start_dt, end_dt)
-    if len(available) < qty:
-        raise ValueError(f"Brak wystarczającej liczby wolnych sztuk ({len(available)} dostępnych).")
+# Po tylu wypożyczeniach egzemplarz wraca ze zwrotu do przeglądu
+INSPECTION_AFTER_RENTALS = 5
+# Obsługa magazynowa: docelowy status -> wymagany status bieżący
+RENTAL_TRANSITIONS = {"WYDANE": "REZERWACJA", "ZAKOŃCZONA": "WYDANE"}
+
+# Constraint EXCLUDE z migracji: ta sama sztuka w nachodzących terminach
+BOOKING_OVERLAP_CONSTRAINT = "ex_pozycje_egzemplarz_okres"
+
+# SQLite nie ma blokad wierszy - rezerwacje w tym trybie przechodzą po kolei
+_sqlite_booking_lock = threading.Lock()
+
+
+@contextmanager
+def _booking_guard(db: Session):
+    if db.get_bind().dialect.name == "sqlite":
+        with _sqlite_booking_lock:
+            yield
+    else:
+        yield
+
+
+def _claim_items(db: Session, model_id: int, qty: int, start_dt: datetime, end_dt: datetime) -> list[int]:
+    # Limit = qty: przy braku sztuk dostajemy i tak dokładną liczbę wolnych
+    item_ids = inv_crud.get_available_item_ids_for_term(db, model_id, start_dt, end_dt, limit=qty, lock=True)
+    if len(item_ids) < qty:
+        db.rollback()
+        raise ValueError(f"Brak wystarczającej liczby wolnych sztuk ({len(item_ids)} dostępnych).")
+    return item_ids
+
 
-    tool_model = db.get(inv_models.ModelNarzedzia, model_id)
-    if not tool_model:
+def _violated_constraint(exc: IntegrityError) -> Optional[str]:
+    diag = getattr(exc.orig, "diag", None)
+    name = getattr(diag, "constraint_name", None)
+    if name:
+        return name
+    # Sterownik bez diag - szukamy nazwy w komunikacie błędu
+    return BOOKING_OVERLAP_CONSTRAINT if BOOKING_OVERLAP_CONSTRAINT in str(exc.orig) else None
+
+
+def _commit_booking(db: Session):
+    try:
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        # Tylko konflikt terminu oznacza, że ktoś zdążył zarezerwować tę samą sztukę
+        if _violated_constraint(exc) != BOOKING_OVERLAP_CONSTRAINT:
+            raise
+        raise ValueError("Wybrane egzemplarze zostały właśnie zarezerwowane. Spróbuj ponownie.") from exc
+
+
+def _create_booking(db: Session, client_id: int, lines: dict[int, int], start_dt: datetime, end_dt: datetime):
+    """Jedno wypożyczenie z pozycjami dla wszystkich linii {model_id: qty}, jeden commit."""
+    tool_models = {
+        m.id: m
+        for m in db.query(inv_models.ModelNarzedzia).filter(inv_models.ModelNarzedzia.id.in_(lines))
+    }
+    if len(tool_models) < len(lines):
         raise ValueError("Nie znaleziono modelu narzędzia.")
 
     delta = end_dt.date() - start_dt.date()
     days = max(delta.days, 1)
-    total_cost = days * tool_model.cena_za_dobe * qty
-
-    new_rental = models.Wypozyczenie(
-        klient_id=client_id,
-        status="REZERWACJA",
-        data_plan_wydania=start_dt,
-        data_plan_zwrotu=end_dt,
-        koszt_calkowity=total_cost,
+    line_costs = {model_id: days * tool_models[model_id].cena_za_dobe * qty for model_id, qty in lines.items()}
+    booked_at = datetime.utcnow()
+
+    with _booking_guard(db):
+        claimed = {
+            model_id: _claim_items(db, model_id, qty, start_dt, end_dt)
+            for model_id, qty in sorted(lines.items())
+        }
+
+        new_rental = models.Wypozyczenie(
+            klient_id=client_id,
+            status="REZERWACJA",
+            data_rezerwacji=booked_at,
+            data_plan_wydania=start_dt,
+            data_plan_zwrotu=end_dt,
+            koszt_calkowity=sum(line_costs.values()),
+        )
+        db.add(new_rental)
+        db.flush()
+
+        for item_ids in claimed.values():
+            for item_id in item_ids:
+                pos = models.PozycjaWypozyczenia(
+                    wypozyczenie_id=new_rental.id,
+                    egzemplarz_id=item_id,
+                    okres_od=start_dt,
+                    okres_do=end_dt,
+                )
+                db.add(pos)
+
+        rollup.record_booking(db, booked_at.date(), [
+            (model_id, tool_models[model_id].kategoria, qty, line_costs[model_id])
+            for model_id, qty in lines.items()
+        ])
+        _commit_booking(db)
+
+    cache.invalidate("wypozyczenia")
+    occupancy.index.add_rental(
+        new_rental.id,
+        start_dt,
+        end_dt,
+        [(model_id, item_id) for model_id, item_ids in claimed.items() for item_id in item_ids],
+    )
+    return new_rental
+
+
+def create_reservation(db: Session, client_id: int, model_id: int, qty: int, start_dt: datetime, end_dt: datetime):
+    return _create_booking(db, client_id, {model_id: qty}, start_dt, end_dt)
+
+
+def create_cart_reservation(db: Session, payload: schemas.CreateRentalRequest):
+    lines: dict[int, int] = {}
+    for line in payload.pozycje:
+        lines[line.model_id] = lines.get(line.model_id, 0) + line.qty
+
+    start_dt, end_dt = payload.data_plan_wydania, payload.data_plan_zwrotu
+    available = inv_crud.count_available_items_for_models(db, list(lines), start_dt, end_dt)
+    shortages = [
+        f"model {model_id}: {available[model_id]} z {qty} szt."
+        for model_id, qty in lines.items()
+        if available[model_id] < qty
+    ]
+    if shortages:
+        raise ValueError("Brak wystarczającej liczby wolnych sztuk (" + "; ".join(shortages) + ").")
+
+    return _create_booking(db, payload.klient_id, lines, start_dt, end_dt)
+
+
+def _load_rentals_for_update(db: Session, rental_ids: list[int]) -> list[models.Wypozyczenie]:
+    """Wypożyczenia z pozycjami i egzemplarzami jednym zapytaniem; blokuje tylko wiersze wypożyczeń."""
+    return (
+        db.query(models.Wypozyczenie)
+        .options(joinedload(models.Wypozyczenie.pozycje).joinedload(models.PozycjaWypozyczenia.egzemplarz))
+        .filter(models.Wypozyczenie.id.in_(rental_ids))
+        .with_for_update(of=models.Wypozyczenie)
+        .all()
     )
-    db.add(new_rental)
-    db.flush()
 
-    for i in range(qty):
-        pos = models.PozycjaWypozyczenia(
-            wypozyczenie_id=new_rental.id,
-            egzemplarz_id=available[i].id,
+
+def _apply_returns(db: Session, rentals: list[models.Wypozyczenie], faults: dict[int, Optional[str]],
+                   magazynier_id: Optional[int] = None) -> Counter:
+    """Zamyka zwrócone wypożyczenia kilkoma UPDATE-ami zbiorczymi (commit należy do wołającego).
+
+    ``faults`` to egzemplarz_id -> opis usterki stwierdzonej przy przyjęciu. Zwraca
+    liczbę egzemplarzy w każdym stanie technicznym po zwrocie.
+    """
+    poz = models.PozycjaWypozyczenia.__table__
+    wyp = models.Wypozyczenie.__table__
+    egz = inv_models.EgzemplarzNarzedzia.__table__
+
+    rental_ids = [r.id for r in rentals]
+    positions = [p for r in rentals for p in r.pozycje]
+    # Egzemplarz zmienia stan raz, nawet jeśli występuje w kilku pozycjach
+    items = {p.egzemplarz_id: p.egzemplarz for p in positions}
+    faulty = {p.egzemplarz_id for p in positions if p.czy_zgloszono_usterke or p.egzemplarz_id in faults}
+
+    reported = [
+        {"b_id": p.id, "b_opis": faults[p.egzemplarz_id]}
+        for p in positions if p.egzemplarz_id in faults
+    ]
+    if reported:
+        db.execute(
+            update(poz)
+            .where(poz.c.id == bindparam("b_id"))
+            .values(czy_zgloszono_usterke=True, opis_usterki=func.coalesce(bindparam("b_opis"), poz.c.opis_usterki)),
+            reported,
         )
-        db.add(pos)
+    db.execute(update(poz).where(poz.c.wypozyczenie_id.in_(rental_ids)).values(aktywna=False))
+
+    deltas: counters.Deltas = {}
+    states = Counter()
+    if items:
+        next_count = egz.c.licznik_wypozyczen + 1
+        db.execute(
+            update(egz)
+            .where(egz.c.id.in_(list(items)))
+            .values(
+                status="W_MAGAZYNIE",
+                licznik_wypozyczen=next_count,
+                stan_techniczny=case(
+                    (egz.c.id.in_(faulty), "AWARIA"),
+                    (next_count >= INSPECTION_AFTER_RENTALS, "WYMAGA_PRZEGLADU"),
+                    else_="SPRAWNY",
+                ),
+            )
+        )
+        for item in items.values():
+            if item.id in faulty:
+                stan = "AWARIA"
+            elif item.licznik_wypozyczen + 1 >= INSPECTION_AFTER_RENTALS:
+                stan = "WYMAGA_PRZEGLADU"
+            else:
+                stan = "SPRAWNY"
+            counters.add_change(deltas, item.model_id, counters.item_state(item), ("W_MAGAZYNIE", stan))
+            states[stan] += 1
+    counters.apply(db, deltas)
+
+    values = {"status": "ZAKOŃCZONA", "data_faktyczna_zwrotu": datetime.utcnow()}
+    if magazynier_id is not None:
+        values["magazynier_przyjmij_id"] = magazynier_id
+    db.execute(update(wyp).where(wyp.c.id.in_(rental_ids)).values(values))
+    return states
+
+
+def _apply_issues(db: Session, rentals: list[models.Wypozyczenie]) -> None:
+    wyp = models.Wypozyczenie.__table__
+    egz = inv_models.EgzemplarzNarzedzia.__table__
+
+    items = {p.egzemplarz_id: p.egzemplarz for r in rentals for p in r.pozycje}
+    if items:
+        db.execute(update(egz).where(egz.c.id.in_(list(items))).values(status="U_KLIENTA"))
+        deltas: counters.Deltas = {}
+        for item in items.values():
+            counters.add_change(deltas, item.model_id, counters.item_state(item), ("U_KLIENTA", item.stan_techniczny))
+        counters.apply(db, deltas)
+
+    db.execute(
+        update(wyp)
+        .where(wyp.c.id.in_([r.id for r in rentals]))
+        .values(status="WYDANE", data_faktyczna_wydania=datetime.utcnow())
+    )
 
-    db.commit()
-    return new_rental
 
+def _apply_rental_action(db: Session, rentals: list[models.Wypozyczenie], nowy_status: str) -> None:
+    if nowy_status == "WYDANE":
+        _apply_issues(db, rentals)
+    else:
+        _apply_returns(db, rentals, {})
 
-def process_rental_action(db: Session, wypozyczenie_id: int, nowy_status: str):
-    wyp_obj = db.query(models.Wypozyczenie).filter(models.Wypozyczenie.id == wypozyczenie_id).first()
-    if not wyp_obj:
-        raise ValueError("Nie znaleziono wypożyczenia.")
 
-    wyp_obj.status = nowy_status
+def process_rental_actions(db: Session, wypozyczenie_ids: list[int], nowy_status: str) -> dict:
+    """Ta sama zmiana statusu dla wielu wypożyczeń stałą liczbą zapytań, w jednej transakcji.
 
+    Wypożyczenia, których nie ma albo których status nie pozwala na przejście,
+    trafiają do ``odrzucone`` z powodem.
+    """
+    required = RENTAL_TRANSITIONS.get(nowy_status)
+    if required is None:
+        raise ValueError(f"Nieobsługiwana akcja: {nowy_status}.")
+
+    ids = list(dict.fromkeys(wypozyczenie_ids))
+    found = {r.id: r for r in _load_rentals_for_update(db, ids)}
+
+    # Przy wydaniu blokujemy też egzemplarze: ten sam egzemplarz może mieć kolejne
+    # (nienachodzące) rezerwacje, a u klienta może być tylko w jednej z nich
+    item_status = {}
     if nowy_status == "WYDANE":
-        wyp_obj.data_faktyczna_wydania = datetime.utcnow()
-        for p in wyp_obj.pozycje:
-            p.egzemplarz.status = "U_KLIENTA"
-
-    elif nowy_status == "ZAKOŃCZONA":
-        wyp_obj.data_faktyczna_zwrotu = datetime.utcnow()
-        for p in wyp_obj.pozycje:
-            egz = p.egzemplarz
-            egz.status = "W_MAGAZYNIE"
-            egz.licznik_wypozyczen += 1
-
-            if p.czy_zgloszono_usterke:
-                egz.stan_techniczny = "AWARIA"
-            elif egz.licznik_wypozyczen >= 5:
-                egz.stan_techniczny = "WYMAGA_PRZEGLADU"
-            else:
-                egz.stan_techniczny = "SPRAWNY"
+        egz = inv_models.EgzemplarzNarzedzia.__table__
+        item_ids = {p.egzemplarz_id for r in found.values() for p in r.pozycje}
+        item_status = dict(db.execute(
+            select(egz.c.id, egz.c.status).where(egz.c.id.in_(item_ids)).with_for_update()
+        ).all()) if item_ids else {}
+
+    accepted, rejected = [], []
+    claimed: set[int] = set()
+    for rental_id in ids:
+        rental = found.get(rental_id)
+        if rental is None:
+            rejected.append({"id": rental_id, "powod": "Nie znaleziono wypożyczenia."})
+            continue
+        if rental.status != required:
+            rejected.append({
+                "id": rental_id,
+                "powod": f"Wypożyczenie ma status {rental.status}, a {nowy_status} wymaga {required}.",
+            })
+            continue
+        if nowy_status == "WYDANE":
+            rental_items = {p.egzemplarz_id for p in rental.pozycje}
+            busy = sorted(i for i in rental_items if i in claimed or item_status.get(i) == "U_KLIENTA")
+            if busy:
+                rejected.append({
+                    "id": rental_id,
+                    "powod": f"Egzemplarze {', '.join(map(str, busy))} są już u klienta lub wydawane w tej partii.",
+                })
+                continue
+            claimed |= rental_items
+        accepted.append(rental)
+
+    # ID przed commitem - po nim obiekty są wygaszone i każdy dostęp to osobny SELECT
+    processed = [r.id for r in accepted]
+    if accepted:
+        _apply_rental_action(db, accepted, nowy_status)
+        db.commit()
+        cache.invalidate("wypozyczenia", "egzemplarze_narzedzi")
+        if nowy_status not in models.ACTIVE_RENTAL_STATUSES:
+            for rental_id in processed:
+                occupancy.index.remove_rental(rental_id)
+
+    return {"przetworzone": processed, "odrzucone": rejected}
+
 
+def process_rental_action(db: Session, wypozyczenie_id: int, nowy_status: str):
+    result = process_rental_actions(db, [wypozyczenie_id], nowy_status)
+    if result["odrzucone"]:
+        raise ValueError(result["odrzucone"][0]["powod"])
+    return db.get(models.Wypozyczenie, wypozyczenie_id)
+
+
+def register_return(db: Session, wypozyczenie_id: int, payload: schemas.RegisterReturnRequest) -> dict:
+    if db.get(user_models.Magazynier, payload.magazynier_przyjmij_id) is None:
+        raise ValueError("Nie znaleziono magazyniera przyjmującego zwrot.")
+
+    rentals = _load_rentals_for_update(db, [wypozyczenie_id])
+    if not rentals:
+        raise ValueError("Nie znaleziono wypożyczenia.")
+    if rentals[0].status != "WYDANE":
+        raise ValueError(f"Zwrot można przyjąć tylko dla wydanego wypożyczenia (status: {rentals[0].status}).")
+
+    issued = {p.egzemplarz_id for p in rentals[0].pozycje}
+    foreign = sorted({z.egzemplarz_id for z in payload.zwroty} - issued)
+    if foreign:
+        raise ValueError(f"Egzemplarze spoza tego wypożyczenia: {', '.join(map(str, foreign))}.")
+
+    faults = {z.egzemplarz_id: z.opis_usterki for z in payload.zwroty if z.czy_zgloszono_usterke}
+    states = _apply_returns(db, rentals, faults, payload.magazynier_przyjmij_id)
     db.commit()
-    return wyp_obj
+    cache.invalidate("wypozyczenia", "egzemplarze_narzedzi")
+    occupancy.index.remove_rental(wypozyczenie_id)
+
+    return {
+        "wypozyczenie_id": wypozyczenie_id,
+        "zwrocone": sum(states.values()),
+        "sprawne": states["SPRAWNY"],
+        "do_przegladu": states["WYMAGA_PRZEGLADU"],
+        "awarie": states["AWARIA"],
+    }
 
 
 def add_service_action(
@@ -99,11 +372,14 @@ def add_service_action(
     db.add(nowa_czynnosc)
 
     if nowy_stan:
+        before = counters.item_state(egzemplarz)
         egzemplarz.stan_techniczny = nowy_stan
         if nowy_stan == "SPRAWNY":
             egzemplarz.licznik_wypozyczen = 0
+        counters.record_change(db, egzemplarz.model_id, before, counters.item_state(egzemplarz))
 
     db.commit()
+    cache.invalidate("egzemplarze_narzedzi")
 
 
 def report_tool_fault(db: Session, pozycja_id: int, opis: str):
@@ -113,24 +389,66 @@ def report_tool_fault(db: Session, pozycja_id: int, opis: str):
 
     pozycja.czy_zgloszono_usterke = True
     pozycja.opis_usterki = opis
+    before = counters.item_state(pozycja.egzemplarz)
     pozycja.egzemplarz.stan_techniczny = "AWARIA"
+    counters.record_change(db, pozycja.egzemplarz.model_id, before, counters.item_state(pozycja.egzemplarz))
 
     db.commit()
+    cache.invalidate("egzemplarze_narzedzi")
     return True
 
 
-def get_customer_rentals(db: Session, klient_id: int):
-    return (
-        db.query(models.Wypozyczenie)
-        .options(
-            joinedload(models.Wypozyczenie.pozycje)
-            .joinedload(models.PozycjaWypozyczenia.egzemplarz)
-            .joinedload(inv_models.EgzemplarzNarzedzia.model)
+def get_customer_rentals(
+    db: Session,
+    klient_id: int,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    cursor: Optional[int] = None,
+    with_total: bool = False,
+) -> dict:
+    """Historia klienta od najnowszych: sumy kaucji i stawek dobowych liczone w SQL, strony po ID."""
+    wyp = models.Wypozyczenie
+    poz = models.PozycjaWypozyczenia
+    egz = inv_models.EgzemplarzNarzedzia
+    mod = inv_models.ModelNarzedzia
+
+    query = (
+        select(
+            wyp.id,
+            wyp.status,
+            wyp.data_plan_wydania,
+            wyp.data_plan_zwrotu,
+            wyp.data_faktyczna_wydania,
+            wyp.data_faktyczna_zwrotu,
+            func.coalesce(func.sum(mod.kaucja), 0).label("suma_kaucji"),
+            func.coalesce(func.sum(mod.cena_za_dobe), 0).label("suma_dniowki"),
+            func.count(egz.id).label("liczba_pozycji"),
         )
-        .filter(models.Wypozyczenie.klient_id == klient_id)
-        .order_by(models.Wypozyczenie.data_rezerwacji.desc())
-        .all()
+        .outerjoin(poz, poz.wypozyczenie_id == wyp.id)
+        .outerjoin(egz, egz.id == poz.egzemplarz_id)
+        .outerjoin(mod, mod.id == egz.model_id)
+        .where(wyp.klient_id == klient_id)
+        .group_by(wyp.id, wyp.status, wyp.data_plan_wydania, wyp.data_plan_zwrotu,
+                  wyp.data_faktyczna_wydania, wyp.data_faktyczna_zwrotu)
     )
+    page = pagination.paginate(db, query, wyp.id, limit, cursor, with_total, descending=True)
+
+    # Pozycje tylko dla wypożyczeń z bieżącej strony, jednym zapytaniem
+    positions: dict[int, list] = {}
+    if page["items"]:
+        rows = db.execute(
+            select(poz.wypozyczenie_id, egz.model_id, mod.nazwa_modelu, egz.numer_seryjny)
+            .join(egz, egz.id == poz.egzemplarz_id)
+            .join(mod, mod.id == egz.model_id)
+            .where(poz.wypozyczenie_id.in_([row["id"] for row in page["items"]]))
+            .order_by(poz.id)
+        )
+        for rental_id, model_id, model_name, serial in rows:
+            positions.setdefault(rental_id, []).append(
+                {"model_id": model_id, "nazwa_modelu": model_name, "numer_seryjny": serial}
+            )
+    for row in page["items"]:
+        row["pozycje"] = positions.get(row["id"], [])
+    return page
 
 
 def create_opinion(db: Session, klient_id: int, model_id: int, ocena: int, komentarz: str):
@@ -148,36 +466,76 @@ def create_opinion(db: Session, klient_id: int, model_id: int, ocena: int, komen
     return new_opinion
 
 
-def list_pending_operations(db: Session):
-    rentals = (
-        db.query(models.Wypozyczenie)
-        .options(
-            joinedload(models.Wypozyczenie.klient),
-            joinedload(models.Wypozyczenie.pozycje)
-            .joinedload(models.PozycjaWypozyczenia.egzemplarz)
-            .joinedload(inv_models.EgzemplarzNarzedzia.model),
+def list_pending_operations(
+    db: Session,
+    typ: Optional[str] = None,
+    client_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    search: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    cursor: Optional[int] = None,
+    with_total: bool = False,
+) -> dict:
+    """Kolejka wydań i zwrotów dla magazynu: projekcja kolumn, strony po ID, pozycje strony jednym zapytaniem."""
+    wyp = models.Wypozyczenie
+    poz = models.PozycjaWypozyczenia
+    egz = inv_models.EgzemplarzNarzedzia
+    mod = inv_models.ModelNarzedzia
+    klient = user_models.Klient
+
+    is_issue = wyp.status == "REZERWACJA"
+    planned = case((is_issue, wyp.data_plan_wydania), else_=wyp.data_plan_zwrotu)
+    client_name = klient.imie + " " + klient.nazwisko
+
+    query = (
+        select(
+            wyp.id,
+            case((is_issue, "WYDANIE"), else_="ZWROT").label("typ"),
+            planned.label("data_planowana"),
+            client_name.label("klient"),
         )
-        .filter(models.Wypozyczenie.status.in_(["REZERWACJA", "WYDANE"]))
-        .all()
+        .join(klient, klient.id == wyp.klient_id)
+        .where(wyp.status.in_(["WYDANE"] if typ == "ZWROT" else ["REZERWACJA"] if typ == "WYDANIE"
+                              else models.ACTIVE_RENTAL_STATUSES))
     )
 
-    results = []
-    for r in rentals:
-        modele = ", ".join(list(set([p.egzemplarz.model.nazwa_modelu for p in r.pozycje])))
-        typ = "WYDANIE" if r.status == "REZERWACJA" else "ZWROT"
-        data = r.data_plan_wydania if r.status == "REZERWACJA" else r.data_plan_zwrotu
-
-        results.append(
-            {
-                "id": r.id,
-                "typ": typ,
-                "data_planowana": data,
-                "klient": f"{r.klient.imie} {r.klient.nazwisko}",
-                "model": modele,
-                "obj": r,
-            }
+    if client_id:
+        query = query.where(wyp.klient_id == client_id)
+    if date_from:
+        query = query.where(planned >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.where(planned < datetime.combine(date_to + timedelta(days=1), time.min))
+    if search:
+        with_model = (
+            select(poz.wypozyczenie_id)
+            .join(egz, egz.id == poz.egzemplarz_id)
+            .join(mod, mod.id == egz.model_id)
+            .where(text_search.contains(db, mod.nazwa_modelu, search))
+        )
+        query = query.where(or_(client_name.ilike(f"%{search}%"), wyp.id.in_(with_model)))
+
+    page = pagination.paginate(db, query, wyp.id, limit, cursor, with_total)
+
+    # Egzemplarze i modele bieżącej strony (do formularza zwrotu) jednym zapytaniem.
+    # Nazwy łączymy w Pythonie - group_concat w SQLite nie zna separatora przy DISTINCT.
+    items: dict[int, list] = {}
+    names: dict[int, set] = {}
+    if page["items"]:
+        rows = db.execute(
+            select(poz.wypozyczenie_id, egz.id, egz.numer_seryjny, mod.nazwa_modelu)
+            .join(egz, egz.id == poz.egzemplarz_id)
+            .join(mod, mod.id == egz.model_id)
+            .where(poz.wypozyczenie_id.in_([op["id"] for op in page["items"]]))
+            .order_by(poz.id)
         )
-    return results
+        for rental_id, item_id, serial, model_name in rows:
+            items.setdefault(rental_id, []).append({"id": item_id, "sn": serial})
+            names.setdefault(rental_id, set()).add(model_name)
+    for op in page["items"]:
+        op["egzemplarze"] = items.get(op["id"], [])
+        op["model"] = ", ".join(sorted(names[op["id"]])) if op["id"] in names else None
+    return page
 
 
 def get_issued_rental_items(db: Session, client_id: Optional[int] = None):
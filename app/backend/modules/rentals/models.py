@@ -1,12 +1,15 @@
 from typing import List, Optional
 from decimal import Decimal
-from datetime import datetime
-from sqlalchemy import String, ForeignKey, Text, Numeric, UniqueConstraint
+from datetime import date, datetime
+from sqlalchemy import String, ForeignKey, Text, Numeric, UniqueConstraint, Index, literal_column
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from app.backend.core.database import Base
+from app.backend.core.database import Base, TimestampMixin
 
+# Statusy, w których wypożyczenie blokuje egzemplarze
+ACTIVE_RENTAL_STATUSES = ("REZERWACJA", "WYDANE")
 
-class Wypozyczenie(Base):
+
+class Wypozyczenie(Base, TimestampMixin):
     __tablename__ = "wypozyczenia"
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     klient_id: Mapped[int] = mapped_column(ForeignKey("klienci.id"))
@@ -22,6 +25,10 @@ class Wypozyczenie(Base):
     status: Mapped[str] = mapped_column(String(20), default="REZERWACJA")
     koszt_calkowity: Mapped[Decimal] = mapped_column(Numeric(10, 2), default=0.00)
 
+    __table_args__ = (
+        Index("ix_wypozyczenia_status_termin", "status", "data_plan_wydania", "data_plan_zwrotu"),
+    )
+
     klient: Mapped["Klient"] = relationship(back_populates="wypozyczenia")
     pozycje: Mapped[List["PozycjaWypozyczenia"]] = relationship(back_populates="wypozyczenie",
                                                                 cascade="all, delete-orphan")
@@ -34,8 +41,15 @@ class PozycjaWypozyczenia(Base):
     egzemplarz_id: Mapped[int] = mapped_column(ForeignKey("egzemplarze_narzedzi.id"))
     czy_zgloszono_usterke: Mapped[bool] = mapped_column(default=False)
     opis_usterki: Mapped[Optional[str]] = mapped_column(Text)
+    # Kopia terminu z wypożyczenia - na niej stoi constraint EXCLUDE w Postgresie
+    okres_od: Mapped[Optional[datetime]]
+    okres_do: Mapped[Optional[datetime]]
+    aktywna: Mapped[bool] = mapped_column(default=True)
 
-    __table_args__ = (UniqueConstraint("wypozyczenie_id", "egzemplarz_id", name="uq_pozycja_wyp_egz"),)
+    __table_args__ = (
+        UniqueConstraint("wypozyczenie_id", "egzemplarz_id", name="uq_pozycja_wyp_egz"),
+        Index("ix_pozycje_egzemplarz_wyp", "egzemplarz_id", "wypozyczenie_id"),
+    )
     wypozyczenie: Mapped["Wypozyczenie"] = relationship(back_populates="pozycje")
     egzemplarz: Mapped["EgzemplarzNarzedzia"] = relationship(back_populates="pozycje_wypozyczenia")
 
@@ -65,3 +79,21 @@ class Opinia(Base):
 
     model: Mapped["ModelNarzedzia"] = relationship(back_populates="opinie")
     klient: Mapped["Klient"] = relationship(back_populates="opinie")
+
+
+class DzienneStatystyki(Base):
+    """Agregat dzienny rezerwacji. Wiersz z ``model_id = NULL`` to suma dnia (liczba
+    wypożyczeń bez dublowania koszyków). Wierszy z tym samym kluczem może być kilka -
+    odczyty zawsze sumują."""
+    __tablename__ = "dzienne_statystyki"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    dzien: Mapped[date]
+    model_id: Mapped[Optional[int]] = mapped_column(ForeignKey("modele_narzedzi.id"))
+    kategoria: Mapped[Optional[str]] = mapped_column(String(50))
+    liczba_wypozyczen: Mapped[int] = mapped_column(default=0)
+    liczba_pozycji: Mapped[int] = mapped_column(default=0)
+    przychod: Mapped[Decimal] = mapped_column(Numeric(12, 2), default=0)
+    # Podbijana przez bazę przy każdym dopisaniu - wersja cache podsumowania dashboardu
+    wersja: Mapped[int] = mapped_column(default=0, onupdate=literal_column("wersja") + 1)
+
+    __table_args__ = (Index("ix_dzienne_statystyki_dzien_model", "dzien", "model_id"),)
@@ -0,0 +1,131 @@
+"""Opcjonalny indeks zajętości egzemplarzy trzymany w pamięci procesu.
+
+Włączany zmienną ``OCCUPANCY_INDEX=1``. Dla każdego modelu trzymamy
+posortowane po dacie wydania przedziały aktywnych wypożyczeń każdego
+egzemplarza, więc sprawdzenie zajętości to bisect zamiast anti-joina w bazie.
+Indeks jest lokalny dla procesu i nie widzi rezerwacji z innych workerów,
+dlatego działa tylko przy ``WEB_CONCURRENCY=1`` i dodatkowo jest odbudowywany
+z bazy co ``OCCUPANCY_INDEX_TTL`` sekund. Rezerwacja (``lock=True``) zawsze
+sprawdza zajętość w SQL.
+"""
+import os
+import threading
+import time
+from bisect import bisect_right, insort
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.backend.modules.inventory import models as inv_models
+
+from . import models
+
+OCCUPANCY_INDEX_REQUESTED = os.getenv("OCCUPANCY_INDEX", "0") == "1"
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+OCCUPANCY_INDEX_ENABLED = OCCUPANCY_INDEX_REQUESTED and WEB_CONCURRENCY == 1
+OCCUPANCY_INDEX_TTL = int(os.getenv("OCCUPANCY_INDEX_TTL", "30"))
+
+# (data_plan_wydania, data_plan_zwrotu, wypozyczenie_id)
+Interval = tuple[datetime, datetime, int]
+
+
+class OccupancyIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_model: dict[int, dict[int, list[Interval]]] = {}
+        self._rentals: dict[int, list[tuple[int, int, Interval]]] = {}
+        self.ready = False
+        self._built_at = 0.0
+
+    @staticmethod
+    def _load(db: Session) -> list[tuple[int, int, Interval]]:
+        rows = db.execute(
+            select(
+                models.Wypozyczenie.id,
+                inv_models.EgzemplarzNarzedzia.model_id,
+                models.PozycjaWypozyczenia.egzemplarz_id,
+                models.Wypozyczenie.data_plan_wydania,
+                models.Wypozyczenie.data_plan_zwrotu,
+            )
+            .join(models.PozycjaWypozyczenia, models.PozycjaWypozyczenia.wypozyczenie_id == models.Wypozyczenie.id)
+            .join(inv_models.EgzemplarzNarzedzia,
+                  inv_models.EgzemplarzNarzedzia.id == models.PozycjaWypozyczenia.egzemplarz_id)
+            .where(
+                models.Wypozyczenie.status.in_(models.ACTIVE_RENTAL_STATUSES),
+                models.Wypozyczenie.data_plan_wydania.is_not(None),
+                models.Wypozyczenie.data_plan_zwrotu.is_not(None),
+            )
+        )
+        return [(model_id, item_id, (start, end, rental_id)) for rental_id, model_id, item_id, start, end in rows]
+
+    def _insert(self, model_id: int, item_id: int, interval: Interval):
+        insort(self._by_model.setdefault(model_id, {}).setdefault(item_id, []), interval)
+        self._rentals.setdefault(interval[2], []).append((model_id, item_id, interval))
+
+    def rebuild(self, db: Session):
+        entries = self._load(db)
+        with self._lock:
+            self._by_model = {}
+            self._rentals = {}
+            for model_id, item_id, interval in entries:
+                self._insert(model_id, item_id, interval)
+            self.ready = True
+            self._built_at = time.monotonic()
+
+    def usable(self, db: Session) -> bool:
+        """Czy można czytać z indeksu; po upływie TTL odbudowuje go z bazy."""
+        if not self.ready:
+            return False
+        if time.monotonic() - self._built_at > OCCUPANCY_INDEX_TTL:
+            self.rebuild(db)
+        return True
+
+    def add_rental(self, rental_id: int, start_dt: datetime, end_dt: datetime, items: list[tuple[int, int]]):
+        """``items`` to pary (model_id, egzemplarz_id) nowych pozycji."""
+        if not self.ready:
+            return
+        with self._lock:
+            for model_id, item_id in items:
+                self._insert(model_id, item_id, (start_dt, end_dt, rental_id))
+
+    def remove_rental(self, rental_id: int):
+        if not self.ready:
+            return
+        with self._lock:
+            for model_id, item_id, interval in self._rentals.pop(rental_id, []):
+                intervals = self._by_model[model_id][item_id]
+                intervals.remove(interval)
+                if not intervals:
+                    del self._by_model[model_id][item_id]
+
+    def busy_item_ids(self, model_id: int, start_dt: datetime, end_dt: datetime) -> set[int]:
+        busy = set()
+        with self._lock:
+            for item_id, intervals in self._by_model.get(model_id, {}).items():
+                # Przedziały zaczynające się po końcu terminu nie mogą na niego nachodzić
+                idx = bisect_right(intervals, (end_dt, datetime.max, 0))
+                if any(iv_end >= start_dt for _, iv_end, _ in intervals[:idx]):
+                    busy.add(item_id)
+        return busy
+
+    def verify(self, db: Session, repair: bool = True) -> dict:
+        expected = set(self._load(db))
+        with self._lock:
+            current = {entry for entries in self._rentals.values() for entry in entries}
+        missing = expected - current
+        stale = current - expected
+
+        consistent = not missing and not stale
+        if not consistent and repair:
+            self.rebuild(db)
+
+        return {
+            "consistent": consistent,
+            "missing": len(missing),
+            "stale": len(stale),
+            "rebuilt": not consistent and repair,
+        }
+
+
+index = OccupancyIndex()
@@ -1,13 +1,20 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 from app.backend.core.schemas import ORMBase
 
 
+class CartLine(BaseModel):
+    model_id: int
+    qty: int = Field(..., ge=1)
+
+
 class CreateRentalRequest(BaseModel):
+    """Koszyk: kilka modeli w jednym wypożyczeniu i jednym terminie."""
     klient_id: int
-    data_plan_wydania: Optional[datetime] = None
-    data_plan_zwrotu: Optional[datetime] = None
+    data_plan_wydania: datetime
+    data_plan_zwrotu: datetime
+    pozycje: List[CartLine] = Field(..., min_length=1)
 
 
 class ReturnedItemFault(BaseModel):
@@ -17,8 +24,14 @@ class ReturnedItemFault(BaseModel):
 
 
 class RegisterReturnRequest(BaseModel):
+    """Przyjęcie zwrotu całego wypożyczenia; ``zwroty`` opisują egzemplarze z uwagami (pozostałe wracają bez usterek)."""
     magazynier_przyjmij_id: int
-    zwroty: List[ReturnedItemFault] = Field(..., min_length=1)
+    zwroty: List[ReturnedItemFault] = Field(default_factory=list)
+
+
+class BatchRentalActionRequest(BaseModel):
+    wypozyczenie_ids: List[int] = Field(..., min_length=1, max_length=500)
+    action: Literal["WYDANE", "ZAKOŃCZONA"]
 
 
 class ServiceActionCreate(BaseModel):
@@ -4,12 +4,30 @@ import streamlit as st
 
 BASE_URL = os.getenv("API_URL", "http://localhost:8000")
 
+# Odpowiedzi z ETagiem: pełny URL -> (etag, odpowiedź). API zwraca 304 bez treści,
+# jeśli dane się nie zmieniły, i wtedy oddajemy zapamiętaną odpowiedź.
+ETAG_CACHE_SIZE = 256
+_etag_cache = {}
+
 
 class APIClient:
     @staticmethod
     def get(endpoint, params=None):
         try:
-            response = requests.get(f"{BASE_URL}{endpoint}", params=params)
+            url = requests.Request("GET", f"{BASE_URL}{endpoint}", params=params).prepare().url
+            cached = _etag_cache.get(url)
+            headers = {"If-None-Match": cached[0]} if cached else None
+
+            response = requests.get(url, headers=headers)
+            if response.status_code == 304 and cached:
+                return cached[1]
+
+            etag = response.headers.get("ETag")
+            if etag and response.status_code == 200:
+                _etag_cache.pop(url, None)
+                _etag_cache[url] = (etag, response)
+                while len(_etag_cache) > ETAG_CACHE_SIZE:
+                    _etag_cache.pop(next(iter(_etag_cache)))
             return response
         except Exception as e:
             st.error(f"Błąd połączenia z API: {e}")
@@ -24,6 +42,16 @@ class APIClient:
             st.error(f"Błąd połączenia z API: {e}")
             return None
 
+    @staticmethod
+    def post_file(endpoint, content: bytes, content_type="text/csv", params=None):
+        try:
+            response = requests.post(f"{BASE_URL}{endpoint}", data=content, params=params,
+                                     headers={"Content-Type": content_type})
+            return response
+        except Exception as e:
+            st.error(f"Błąd połączenia z API: {e}")
+            return None
+
     @staticmethod
     def patch(endpoint, data=None, params=None):
         try:
@@ -1,3 +1,6 @@
+import streamlit as st
+
+
 def check_password_strength_live(password: str):
     """Funkcja wspólna dla Rejestracji i Zmiany hasła."""
     if not password:
@@ -15,3 +18,33 @@ def check_password_strength_live(password: str):
         return score, "🟡 Średnie hasło", "orange"
     else:
         return score, "🟢 Mocne hasło", "green"
+
+
+def current_page_cursor(state_key: str, filters: tuple):
+    """Kursor bieżącej strony listy stronicowanej po kluczu. Zmiana filtrów wraca na 1. stronę."""
+    state = st.session_state.setdefault(state_key, {"filters": filters, "cursors": [None], "total": None})
+    if state["filters"] != filters:
+        state.update(filters=filters, cursors=[None], total=None)
+    return state["cursors"][-1]
+
+
+def render_pager(state_key: str, page: dict):
+    state = st.session_state[state_key]
+    if page.get("total") is not None:
+        state["total"] = page["total"]
+
+    c_prev, c_info, c_next = st.columns([1, 2, 1])
+    if c_prev.button("⬅️ Poprzednia", key=f"{state_key}_prev", disabled=len(state["cursors"]) == 1,
+                     use_container_width=True):
+        state["cursors"].pop()
+        st.rerun()
+
+    info = f"Strona {len(state['cursors'])}"
+    if state["total"] is not None:
+        info += f" · wyników: {state['total']}"
+    c_info.caption(info)
+
+    if c_next.button("Następna ➡️", key=f"{state_key}_next", disabled=page.get("next_cursor") is None,
+                     use_container_width=True):
+        state["cursors"].append(page["next_cursor"])
+        st.rerun()
@@ -1,9 +1,16 @@
 import streamlit as st
+import pandas as pd
 import datetime as dt
 from datetime import datetime, timedelta
 import time as py_time
 from collections import Counter
 
+from app.frontend.utils import current_page_cursor, render_pager
+
+HISTORY_PAGE_SIZE = 20
+# Limit model_ids w AvailabilityBatchRequest po stronie API
+AVAILABILITY_BATCH_SIZE = 500
+
 
 # --- FUNKCJE CACHE ---
 
@@ -14,11 +21,36 @@ def get_cached_catalog(_api):
 
 
 @st.cache_data(ttl=60)
-def get_cached_history(_api, client_id):
-    resp = _api.get(f"/rentals/customer/{client_id}")
+def get_cached_availability(_api, model_ids, dt_start, dt_end):
+    """Wolne sztuki w terminie dla wszystkich modeli z listy - jedno zapytanie do API na paczkę modeli."""
+    model_ids = list(model_ids)
+    counts = {}
+    for i in range(0, len(model_ids), AVAILABILITY_BATCH_SIZE):
+        resp = _api.post("/inventory/availability/batch", data={
+            "model_ids": model_ids[i:i + AVAILABILITY_BATCH_SIZE],
+            "start_dt": dt_start,
+            "end_dt": dt_end
+        })
+        if resp and resp.status_code == 200:
+            counts.update({row["model_id"]: row["count"] for row in resp.json()})
+    return counts
+
+
+@st.cache_data(ttl=60)
+def get_cached_calendar(_api, model_id, d_from, d_to):
+    resp = _api.get(f"/inventory/models/{model_id}/calendar", params={"from": str(d_from), "to": str(d_to)})
     return resp.json() if resp and resp.status_code == 200 else []
 
 
+@st.cache_data(ttl=60)
+def get_cached_history(_api, client_id, cursor=None):
+    params = {"limit": HISTORY_PAGE_SIZE, "with_total": cursor is None}
+    if cursor is not None:
+        params["cursor"] = cursor
+    resp = _api.get(f"/rentals/customer/{client_id}", params=params)
+    return resp.json() if resp and resp.status_code == 200 else {"items": [], "next_cursor": None, "total": None}
+
+
 @st.cache_data(ttl=60)
 def get_cached_issued_items(_api, client_id):
     resp = _api.get(f"/rentals/customer/{client_id}/issued")
@@ -67,12 +99,22 @@ def report_fault_dialog(api, item):
 
 
 @st.dialog("Rezerwacja narzędzia")
-def reserve_tool_dialog(api, model, user):
+def reserve_tool_dialog(api, model, user, term_start=None, term_end=None):
     st.subheader(f"🛒 {model['nazwa_modelu']}")
+    today = datetime.now().date()
+
+    with st.expander("📅 Kalendarz dostępności (60 dni)"):
+        calendar = get_cached_calendar(api, model['id'], today, today + timedelta(days=59))
+        if calendar:
+            df_cal = pd.DataFrame(calendar)
+            df_cal['date'] = pd.to_datetime(df_cal['date'])
+            st.bar_chart(df_cal.set_index('date')['count'], color="#2ECC71")
+            st.caption("Liczba wolnych sztuk w poszczególnych dniach.")
 
     c1, c2 = st.columns(2)
-    d_start = c1.date_input("Planowana data odbioru", min_value=datetime.now().date())
-    d_end = c2.date_input("Planowana data zwrotu", min_value=d_start + timedelta(days=1))
+    d_start = c1.date_input("Planowana data odbioru", value=term_start or today, min_value=today)
+    d_end = c2.date_input("Planowana data zwrotu", value=max(term_end or d_start, d_start + timedelta(days=1)),
+                          min_value=d_start + timedelta(days=1))
 
     dt_start = datetime.combine(d_start, dt.time.min).isoformat()
     dt_end = datetime.combine(d_end, dt.time.max).isoformat()
@@ -122,6 +164,11 @@ def reserve_tool_dialog(api, model, user):
                     st.rerun()
         else:
             st.error("Brak wolnych egzemplarzy w tym terminie.")
+            nxt = api.get(f"/inventory/models/{model['id']}/next-available",
+                          params={"qty": 1, "duration_days": max((d_end - d_start).days, 1), "after": str(d_start)})
+            if nxt and nxt.status_code == 200:
+                window = nxt.json()
+                st.info(f"💡 Najbliższy wolny termin: **{window['start_dt'][:10]}** – **{window['end_dt'][:10]}**")
 
 
 @st.dialog("Twoja opinia ma znaczenie!")
@@ -204,6 +251,11 @@ def show_client_catalog(api, user):
         f_cat = c2.selectbox("Kategoria", cats)
         f_prod = c3.selectbox("Producent", prods)
         f_price = c4.number_input("Max cena/doba", value=2000)
+        t1, t2 = st.columns(2)
+        today = datetime.now().date()
+        term_start = t1.date_input("📅 Odbiór od", value=today, min_value=today)
+        term_end = t2.date_input("📅 Zwrot do", value=term_start + timedelta(days=1),
+                                 min_value=term_start + timedelta(days=1))
 
     filtered_models = [
         m for m in all_data
@@ -216,10 +268,18 @@ def show_client_catalog(api, user):
     if not filtered_models:
         st.warning("Nie znaleziono narzędzi spełniających kryteria.")
     else:
+        # Jedno zapytanie o dostępność w terminie dla całej strony katalogu
+        availability = get_cached_availability(
+            api,
+            tuple(m['ModelNarzedzia']['id'] for m in filtered_models),
+            datetime.combine(term_start, dt.time.min).isoformat(),
+            datetime.combine(term_end, dt.time.max).isoformat(),
+        )
+
         st.divider()
         for m in filtered_models:
             model = m['ModelNarzedzia']
-            q = m.get('liczba_sztuk', 0)
+            q = availability.get(model['id'], 0)
 
             with st.container(border=False):
                 col_main, col_price, col_deposit = st.columns([2.5, 1, 1])
@@ -246,12 +306,12 @@ def show_client_catalog(api, user):
                     if q > 0:
                         st.markdown(
                             f"<div style='text-align: center; padding-top: 5px; font-weight: bold; color: green;'>✅ "
-                            f"Dostępne: {q} szt.</div>",
+                            f"Dostępne w terminie: {q} szt.</div>",
                             unsafe_allow_html=True)
                     else:
                         st.markdown(
                             f"<div style='text-align: center; padding-top: 5px; font-weight: bold; color: gray;'>❌ "
-                            f"Chwilowy brak</div>",
+                            f"Brak w terminie</div>",
                             unsafe_allow_html=True)
 
                 with c_res:
@@ -265,14 +325,15 @@ def show_client_catalog(api, user):
                     else:
                         if st.button("🛒 Zarezerwuj teraz", key=f"res_{model['id']}",
                                      type="primary", use_container_width=True):
-                            reserve_tool_dialog(api, model, user)
+                            reserve_tool_dialog(api, model, user, term_start, term_end)
 
                 st.divider()
 
 
 def show_rentals_history(api, user):
     st.title("📜 Twoja Historia Wypożyczeń")
-    rentals = get_cached_history(api, user['id'])
+    page = get_cached_history(api, user['id'], current_page_cursor("history_pager", (user['id'],)))
+    rentals = page["items"]
 
     if not rentals:
         st.info("Nie masz jeszcze żadnych wypożyczeń.")
@@ -342,6 +403,8 @@ def show_rentals_history(api, user):
                 else:
                     st.caption("✅ Oceniłeś już to narzędzie. Dzięki!")
 
+    render_pager("history_pager", page)
+
 
 def show_report_fault_view(api, user):
     st.title("⚠️ Zgłoś awarię sprzętu")
@@ -248,7 +248,7 @@ def render_analytics_section(api):
     d_from = c1.date_input("Od", date.today() - timedelta(days=30))
     d_to = c2.date_input("Do", date.today())
 
-    summary = api.get("/analytics/summary", params={"date_from": d_from, "date_to": d_to}).json()
+    summary = get_cached_analytics(api, d_from, d_to)
     top_models = api.get("/analytics/top-models", params={"limit": 10}).json()
     categories = api.get("/analytics/categories").json()
 
@@ -283,11 +283,19 @@ def render_analytics_section(api):
 
 def render_export_section(api):
     st.header("⬇️ Eksport")
-    table = st.selectbox("Tabela", ["pracownicy", "modele_narzedzi", "wypozyczenia"])
+    export_format = st.radio("Format", ["CSV", "Parquet"], horizontal=True,
+                             help="Parquet: gotowe fakty wypożyczeń (pozycja + model + klient) do pandas.")
+    if export_format == "Parquet":
+        table, file_name = "wypozyczenia", "wypozyczenia_fakty.parquet"
+        st.caption("Eksport obejmuje wszystkie pozycje wypożyczeń z danymi modelu i klienta.")
+    else:
+        table = st.selectbox("Tabela", ["pracownicy", "modele_narzedzi", "wypozyczenia"])
+        file_name = f"{table}.csv"
+
     if st.button("Generuj i pobierz", use_container_width=True):
-        resp = api.get(f"/analytics/export/{table}")
+        resp = api.get(f"/analytics/export/{table}", params={"format": export_format.lower()})
         if resp:
-            st.download_button("Pobierz CSV", data=resp.content, file_name=f"{table}.csv")
+            st.download_button(f"Pobierz {export_format}", data=resp.content, file_name=file_name)
 
 
 def show_manager_ui(api, section):
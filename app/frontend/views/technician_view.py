@@ -1,12 +1,28 @@
 import streamlit as st
 
+from app.frontend.utils import current_page_cursor, render_pager
+
+WORKSHOP_PAGE_SIZE = 50
+
 # --- FUNKCJE CACHE ---
 
 @st.cache_data(ttl=300)
-def get_cached_workshop_items(_api):
-    """Pobiera tylko te narzędzia, które fizycznie są w warsztacie."""
-    resp = _api.get("/inventory/items", params={"location": "W_WARSZTACIE"})
-    return resp.json() if resp and resp.status_code == 200 else []
+def get_cached_workshop_items(_api, filters: tuple, cursor=None):
+    """Pobiera stronę narzędzi, które fizycznie są w warsztacie."""
+    params = {**dict(filters), "limit": WORKSHOP_PAGE_SIZE, "with_total": cursor is None}
+    if cursor is not None:
+        params["cursor"] = cursor
+    resp = _api.get("/rentals/workshop", params=params)
+    return resp.json() if resp and resp.status_code == 200 else {"items": [], "next_cursor": None, "total": None}
+
+
+@st.cache_data(ttl=300)
+def get_cached_filter_options(_api):
+    resp = _api.get("/inventory/models/summary")
+    models = [m["ModelNarzedzia"] for m in resp.json()] if resp and resp.status_code == 200 else []
+    categories = sorted({m["kategoria"] for m in models if m.get("kategoria")})
+    producers = sorted({m["producent"] for m in models if m.get("producent")})
+    return categories, producers
 
 
 # --- DIALOGI ---
@@ -62,30 +78,23 @@ def service_action_dialog(api, item, user, rodzaj):
 def show_technician_ui(api, user):
     st.title("🔧 Zarządzanie narzędziami (Warsztat)")
 
-    all_items = get_cached_workshop_items(api)
-
-    if not all_items:
-        st.info("Warsztat jest obecnie pusty. Wszystkie narzędzia są sprawne lub u klientów.")
-        return
-
-    categories = ["Wszystkie"] + sorted(list(set(i.get('category', 'Narzędzia') for i in all_items)))
-    producers = ["Wszyscy"] + sorted(list(set(i.get('producer', 'Różni') for i in all_items)))
+    categories, producers = get_cached_filter_options(api)
 
     with st.container(border=True):
         c1, c2, c3 = st.columns([2, 1, 1])
         search_q = c1.text_input("🔍 Szukaj po modelu lub numerze seryjnym")
-        f_cat = c2.selectbox("Kategoria", categories)
-        f_prod = c3.selectbox("Producent", producers)
+        f_cat = c2.selectbox("Kategoria", ["Wszystkie"] + categories)
+        f_prod = c3.selectbox("Producent", ["Wszyscy"] + producers)
 
-    filtered = [
-        i for i in all_items if
-        (search_q.lower() in i['model_name'].lower() or search_q.lower() in i['sn'].lower()) and
-        (f_cat == "Wszystkie" or i.get('category') == f_cat) and
-        (f_prod == "Wszyscy" or i.get('producer') == f_prod)
-    ]
+    filters = (("search", search_q), ("category", f_cat), ("producer", f_prod))
+    page = get_cached_workshop_items(api, filters, current_page_cursor("workshop_pager", filters))
+    filtered = page["items"]
 
     if not filtered:
-        st.warning("Brak narzędzi pasujących do filtrów.")
+        if not search_q and f_cat == "Wszystkie" and f_prod == "Wszyscy":
+            st.info("Warsztat jest obecnie pusty. Wszystkie narzędzia są sprawne lub u klientów.")
+        else:
+            st.warning("Brak narzędzi pasujących do filtrów.")
     else:
         h1, h2, h3, h4, h5, h6 = st.columns([0.5, 2, 1.2, 1, 1.2, 1.8])
         h1.write("**ID**"); h2.write("**Model**"); h3.write("**SN**")
@@ -115,4 +124,6 @@ def show_technician_ui(api, user):
                         service_action_dialog(api, item, user, "PRZEGLAD")
 
                 if c_note.button("📝", key=f"note_{item['id']}", help="Notatka"):
-                    service_action_dialog(api, item, user, "NOTATKA")
\ No newline at end of file
+                    service_action_dialog(api, item, user, "NOTATKA")
+
+    render_pager("workshop_pager", page)
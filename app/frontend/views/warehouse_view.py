@@ -1,5 +1,12 @@
+from datetime import date
+
 import streamlit as st
 
+from app.frontend.utils import current_page_cursor, render_pager
+
+ITEMS_PAGE_SIZE = 50
+PENDING_PAGE_SIZE = 50
+
 
 # --- FUNKCJE CACHE ---
 
@@ -10,15 +17,22 @@ def get_cached_summary(_api):
 
 
 @st.cache_data(ttl=60)  # Krótszy cache dla wypożyczeń, bo tu ruch jest większy
-def get_cached_pending_rentals(_api):
-    resp = _api.get("/rentals/pending")
-    return resp.json() if resp and resp.status_code == 200 else []
+def get_cached_pending_rentals(_api, filters: tuple, cursor=None):
+    params = {k: v for k, v in filters if v}
+    params.update(limit=PENDING_PAGE_SIZE, with_total=cursor is None)
+    if cursor is not None:
+        params["cursor"] = cursor
+    resp = _api.get("/rentals/pending", params=params)
+    return resp.json() if resp and resp.status_code == 200 else {"items": [], "next_cursor": None, "total": None}
 
 
 @st.cache_data(ttl=300)
-def get_cached_items(_api):
-    resp = _api.get("/inventory/items")
-    return resp.json() if resp and resp.status_code == 200 else []
+def get_cached_items(_api, filters: tuple, cursor=None):
+    params = {**dict(filters), "limit": ITEMS_PAGE_SIZE, "with_total": cursor is None}
+    if cursor is not None:
+        params["cursor"] = cursor
+    resp = _api.get("/inventory/items", params=params)
+    return resp.json() if resp and resp.status_code == 200 else {"items": [], "next_cursor": None, "total": None}
 
 
 # --- DIALOGI ---
@@ -34,7 +48,7 @@ def receive_delivery_dialog(api, available_models):
 
     with st.form("delivery_form"):
         selected_label = st.selectbox("Model narzędzia*", list(model_options.keys()))
-        quantity = st.number_input("Liczba nowych sztuk*", min_value=1, max_value=100, value=1)
+        quantity = st.number_input("Liczba nowych sztuk*", min_value=1, max_value=100_000, value=1)
 
         if st.form_submit_button("Zatwierdź dostawę", use_container_width=True):
             model_id = model_options[selected_label]
@@ -48,6 +62,32 @@ def receive_delivery_dialog(api, available_models):
                 st.error("Błąd podczas rejestracji dostawy.")
 
 
+@st.dialog("Przyjmij zwrot")
+def register_return_dialog(api, op, user):
+    st.write(f"Wypożyczenie `{op['id']}` · {op['klient']}")
+    labels = {e["id"]: f"{e['sn']} (ID {e['id']})" for e in op.get("egzemplarze", [])}
+
+    with st.form(f"return_form_{op['id']}"):
+        faulty = st.multiselect("Egzemplarze z usterką stwierdzoną przy przyjęciu", list(labels),
+                                format_func=labels.get)
+        opis = st.text_input("Opis usterki (opcjonalnie)")
+
+        if st.form_submit_button("Zatwierdź zwrot", use_container_width=True, type="primary"):
+            payload = {
+                "magazynier_przyjmij_id": user["id"],
+                "zwroty": [
+                    {"egzemplarz_id": item_id, "czy_zgloszono_usterke": True, "opis_usterki": opis or None}
+                    for item_id in faulty
+                ],
+            }
+            resp = api.post(f"/rentals/{op['id']}/return", data=payload)
+            if resp is not None and resp.status_code == 200:
+                st.cache_data.clear()
+                st.rerun()
+            elif resp is not None:
+                st.error(f"Błąd: {resp.json().get('detail', resp.text)}")
+
+
 # --- SEKCJE RENDEROWANIA ---
 
 def render_receive_resources(api):
@@ -91,68 +131,102 @@ def render_receive_resources(api):
         if st.button("➕ ZAREJESTRUJ DOSTAWĘ", type="primary", use_container_width=True):
             receive_delivery_dialog(api, model_data)
 
+    with st.expander("📄 Import dostawy z pliku CSV"):
+        st.caption("Kolumny: numer_seryjny, model_id lub producent + nazwa_modelu, opcjonalnie data_zakupu. "
+                   "Nowy model wymaga kolumn kategoria i cena_za_dobe.")
+        uploaded = st.file_uploader("Plik CSV", type=["csv"])
+        if uploaded and st.button("Importuj", use_container_width=True):
+            resp = api.post_file("/inventory/import", uploaded.getvalue())
+            if resp is not None and resp.status_code == 201:
+                result = resp.json()
+                st.cache_data.clear()
+                st.success(f"Dodano modeli: {result['modele_dodane']}, egzemplarzy: {result['egzemplarze_dodane']}.")
+            elif resp is not None:
+                detail = resp.json().get("detail")
+                if isinstance(detail, dict):
+                    st.error(detail["message"])
+                    st.dataframe({"Błąd": detail["errors"]}, use_container_width=True)
+                else:
+                    st.error(detail)
+
 
-def render_loans_section(api):
+def render_loans_section(api, user):
     st.header("📦 Obsługa Wypożyczeń i Zwrotów")
 
-    # POBIERANIE Z CACHE
-    operations = get_cached_pending_rentals(api)
+    with st.container(border=True):
+        c1, c2, c3 = st.columns([2, 1, 1.5])
+        search_q = c1.text_input("🔍 Szukaj (Klient/Model)...")
+        f_typ = c2.selectbox("Typ operacji", ["Wszystkie", "WYDANIE", "ZWROT"])
+        f_dates = c3.date_input("Planowana data (od - do)", value=(), format="YYYY-MM-DD")
 
-    if operations:
-        all_clients = ["Wszystkie"] + sorted(list(set(op["klient"] for op in operations)))
-        with st.container(border=True):
-            c1, c2, c3 = st.columns([2, 1, 1])
-            search_q = c1.text_input("🔍 Szukaj (Klient/Model)...")
-            f_typ = c2.selectbox("Typ operacji", ["Wszystkie", "WYDANIE", "ZWROT"])
-            f_klient = c3.selectbox("Klient", all_clients)
-
-        filtered = [op for op in operations if
-                    (search_q.lower() in op["klient"].lower() or search_q.lower() in op["model"].lower()) and
-                    (f_typ == "Wszystkie" or op["typ"] == f_typ) and
-                    (f_klient == "Wszystkie" or op["klient"] == f_klient)]
-
-        if not filtered:
-            st.info("Brak oczekujących operacji.")
-        else:
-            st.divider()
-            for op in filtered:
-                c1, c2, c3, c4, c5, c6 = st.columns([0.5, 1, 1.2, 1.5, 1.5, 1.2])
-                c1.write(f"`{op['id']}`")
-                typ_color = "blue" if op["typ"] == "WYDANIE" else "orange"
-                c2.markdown(f":{typ_color}[**{op['typ']}**]")
-                c3.write(op['data_planowana'].split("T")[0])
-                c4.write(op["klient"]);
-                c5.write(op["model"])
-
-                with c6:
-                    target_status = "WYDANE" if op["typ"] == "WYDANIE" else "ZAKOŃCZONA"
-                    if st.button("Zatwierdź", key=f"act_{op['id']}", use_container_width=True, type="primary"):
-                        res = api.post(f"/rentals/{op['id']}/process", params={"action": target_status})
+    date_from = f_dates[0].isoformat() if len(f_dates) > 0 else None
+    date_to = f_dates[1].isoformat() if len(f_dates) > 1 else None
+    filters = (("search", search_q), ("typ", None if f_typ == "Wszystkie" else f_typ),
+               ("date_from", date_from), ("date_to", date_to))
+
+    # Filtrowanie i stronicowanie po stronie API
+    page = get_cached_pending_rentals(api, filters, current_page_cursor("pending_pager", filters))
+    operations = page["items"]
+
+    if not operations:
+        st.info("Brak oczekujących operacji.")
+    else:
+        st.divider()
+        for op in operations:
+            c1, c2, c3, c4, c5, c6 = st.columns([0.5, 1, 1.2, 1.5, 1.5, 1.2])
+            c1.write(f"`{op['id']}`")
+            typ_color = "blue" if op["typ"] == "WYDANIE" else "orange"
+            c2.markdown(f":{typ_color}[**{op['typ']}**]")
+            c3.write(op['data_planowana'].split("T")[0])
+            c4.write(op["klient"]);
+            c5.write(op["model"])
+
+            with c6:
+                if st.button("Zatwierdź", key=f"act_{op['id']}", use_container_width=True, type="primary"):
+                    if op["typ"] == "ZWROT":
+                        register_return_dialog(api, op, user)
+                    else:
+                        res = api.post(f"/rentals/{op['id']}/process", params={"action": "WYDANE"})
                         if res:
                             st.cache_data.clear()  # CZYSZCZENIE: Status wypożyczenia się zmienił
                             st.rerun()
 
+        # Zbiorczo wydajemy tylko rezerwacje z terminem do dziś (albo do końca wybranego zakresu dat)
+        cutoff = date_to or date.today().isoformat()
+        issues = [op["id"] for op in operations if op["typ"] == "WYDANIE" and op["data_planowana"][:10] <= cutoff]
+        if issues:
+            with st.expander(f"🚚 Wydaj widoczne rezerwacje z terminem do {cutoff} ({len(issues)})"):
+                st.write(", ".join(f"#{rental_id}" for rental_id in issues))
+                confirmed = st.checkbox(f"Potwierdzam wydanie {len(issues)} wypożyczeń", key="confirm_batch_issue")
+                if st.button("Wydaj zbiorczo", use_container_width=True, disabled=not confirmed):
+                    res = api.post("/rentals/process", data={"wypozyczenie_ids": issues, "action": "WYDANE"})
+                    if res is not None and res.status_code == 200:
+                        result = res.json()
+                        st.success(f"Wydano {len(result['przetworzone'])} wypożyczeń.")
+                        for rejected in result["odrzucone"]:
+                            st.warning(f"Wypożyczenie {rejected['id']}: {rejected['powod']}")
+                        st.cache_data.clear()
+
+    render_pager("pending_pager", page)
 
 def render_browse_tools_section(api):
     st.header("🔍 Zarządzaj egzemplarzami")
 
-    # POBIERANIE Z CACHE
-    items = get_cached_items(api)
-
-    if items:
-        with st.container(border=True):
-            c1, c2, c3 = st.columns([2, 1, 1])
-            search = c1.text_input("🔍 Szukaj (SN/Model)...")
-            f_loc = c2.selectbox("Lokalizacja", ["Wszystkie", "W_MAGAZYNIE", "U_KLIENTA", "W_WARSZTACIE"])
-            f_stan = c3.selectbox("Stan techniczny", ["Wszystkie", "SPRAWNY", "AWARIA", "WYMAGA_PRZEGLADU"])
-
-        # Filtrowanie lokalne
-        filtered = [i for i in items if
-                    (search.lower() in i['model_name'].lower() or search.lower() in i['sn'].lower()) and
-                    (f_loc == "Wszystkie" or i['status'] == f_loc) and
-                    (f_stan == "Wszystkie" or i['stan'] == f_stan)]
-
-        for i in filtered:
+    with st.container(border=True):
+        c1, c2, c3 = st.columns([2, 1, 1])
+        search = c1.text_input("🔍 Szukaj (SN/Model)...")
+        f_loc = c2.selectbox("Lokalizacja", ["Wszystkie", "W_MAGAZYNIE", "U_KLIENTA", "W_WARSZTACIE"])
+        f_stan = c3.selectbox("Stan techniczny", ["Wszystkie", "SPRAWNY", "AWARIA", "WYMAGA_PRZEGLADU"])
+
+    # Filtrowanie i stronicowanie po stronie API
+    filters = (("search", search), ("location", f_loc), ("tech_state", f_stan))
+    page = get_cached_items(api, filters, current_page_cursor("items_pager", filters))
+    items = page["items"]
+
+    if not items:
+        st.info("Brak egzemplarzy pasujących do filtrów.")
+    else:
+        for i in items:
             col1, col2, col3, col4, col5, col6 = st.columns([0.5, 1.5, 1, 1, 1, 2.5])
             col1.write(f"`{i['id']}`");
             col2.write(i['model_name']);
@@ -189,6 +263,39 @@ def render_browse_tools_section(api):
                             st.cache_data.clear()  # CZYSZCZENIE
                             st.rerun()
 
+        render_bulk_actions(api, items)
+
+    render_pager("items_pager", page)
+
+
+def render_bulk_actions(api, items):
+    with st.expander("📦 Akcja dla wielu egzemplarzy"):
+        labels = {i['id']: f"{i['id']} · {i['model_name']} · {i['sn']} ({i['status']}, {i['stan']})" for i in items}
+        selected = st.multiselect("Egzemplarze z tej strony", list(labels), format_func=labels.get)
+        action = st.selectbox("Akcja", ["Zgłoś awarię", "Wymaga przeglądu", "Przekaż do serwisu", "Odbierz z serwisu"],
+                              key="bulk_action")
+
+        if st.button("Wykonaj dla zaznaczonych", disabled=not selected):
+            if action == "Zgłoś awarię":
+                resp = api.patch("/inventory/items/bulk/state", data={"item_ids": selected, "new_state": "AWARIA"})
+            elif action == "Wymaga przeglądu":
+                resp = api.patch("/inventory/items/bulk/state",
+                                 data={"item_ids": selected, "new_state": "WYMAGA_PRZEGLADU"})
+            elif action == "Przekaż do serwisu":
+                resp = api.post("/inventory/items/bulk/send-to-service", data={"item_ids": selected})
+            else:
+                resp = api.post("/inventory/items/bulk/receive-from-service", data={"item_ids": selected})
+
+            if resp is not None and resp.status_code == 200:
+                result = resp.json()
+                if result["zmienione"]:
+                    st.success(f"Zmieniono {len(result['zmienione'])} egzemplarzy.")
+                for rejected in result["odrzucone"]:
+                    st.warning(f"Egzemplarz {rejected['id']}: {rejected['powod']}")
+                st.cache_data.clear()
+            elif resp is not None:
+                st.error(f"Błąd: {resp.text}")
+
 
 def show_warehouseman_ui(api, user, section):
     if st.sidebar.button("🔄 Odśwież dane"):
@@ -196,7 +303,7 @@ def show_warehouseman_ui(api, user, section):
         st.rerun()
 
     if section == "📦 Wypożyczenia":
-        render_loans_section(api)
+        render_loans_section(api, user)
     elif section == "📥 Przyjmij zasoby":
         render_receive_resources(api)
     elif section == "🔍 Przeglądaj narzędzia":